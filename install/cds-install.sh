@@ -18,5 +18,4 @@ pip3 install cdsapi
 pip3 install netCDF4
 pip3 install matplotlib
 pip3 install pandas
-pip3 install tabulate
-pip3 install seaborn
+pip3 install pyarrow # for show-data.py --format parquet or arrow
@@ -0,0 +1,107 @@
+#
+# Call as follows
+#
+#   python3 scripts/bench-imports.py [options]
+#
+# Measures the startup cost of the commands: for each of the modules
+# behind them, the time to import it in a fresh interpreter, and the
+# wall time of the whole interpreter run. Also checks that importing
+# a module does not import the heavy dependencies that only some
+# features need (e.g., matplotlib for plotting, cdsapi for requests to
+# CDS). Exits with status 1 if any import takes longer than its budget
+# or pulls in a dependency it should not.
+#
+# The possible options are:
+#
+#   --repeat n             Import each module in n fresh interpreters and
+#                          take the fastest run. The default is 5.
+#   --budget module s      Allow 's' seconds for importing 'module'
+#                          instead of its default budget below.
+#   --output file.json     Also write the results to the given file.
+#
+
+import sys
+import os
+import json
+import time
+import subprocess
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+#
+# The modules, their default import budgets in seconds, and the modules
+# they must not import. The budgets leave room for slower machines;
+# pandas alone takes about 0.4 s to import.
+#
+
+modules = [
+    ("caveweather",          0.05, ["caveweather.pulldata", "caveweather.showdata", "pandas", "netCDF4"]),
+    ("caveweather.showdata", 0.80, ["caveweather.pulldata", "netCDF4", "matplotlib", "cdsapi", "seaborn"]),
+    ("caveweather.pulldata", 0.40, ["caveweather.showdata", "pandas", "matplotlib", "cdsapi", "seaborn"])
+]
+
+probe = """
+import sys, time, json
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+def measure(module, forbidden):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = src + os.pathsep + env.get("PYTHONPATH", "")
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", probe % (module, forbidden)], env = env,
+                            check = True, stdout = subprocess.PIPE, universal_newlines = True).stdout
+    wall = time.perf_counter() - start
+    result = json.loads(output)
+    result["wall"] = wall
+    return(result)
+
+def main():
+    repeat = 5
+    budgets = {}
+    output = ""
+    argv = sys.argv[1:]
+    i = 0
+    while (i < len(argv)):
+        opt = argv[i]
+        if (opt == "--repeat"):
+            repeat = int(argv[i+1])
+            i = i + 2
+        elif (opt == "--budget"):
+            budgets[argv[i+1]] = float(argv[i+2])
+            i = i + 3
+        elif (opt == "--output"):
+            output = argv[i+1]
+            i = i + 2
+        else:
+            print("Unrecognised option " + opt)
+            sys.exit(1)
+    results = []
+    failed = 0
+    for (module, budget, forbidden) in modules:
+        budget = budgets.get(module, budget)
+        runs = [measure(module, forbidden) for n in range(repeat)]
+        best = min(runs, key = lambda run: run["seconds"])
+        status = "ok"
+        if (best["seconds"] > budget):
+            status = "over budget"
+        if (len(best["loaded"]) > 0):
+            status = "imports " + " ".join(best["loaded"])
+        if (status != "ok"):
+            failed = failed + 1
+        print("%-22s import %6.3f s  budget %6.3f s  startup %6.3f s  %s" %
+              (module, best["seconds"], budget, min([run["wall"] for run in runs]), status))
+        results.append({"module": module, "seconds": best["seconds"], "budget": budget,
+                        "startup": min([run["wall"] for run in runs]), "loaded": best["loaded"]})
+    if (output != ""):
+        with open(output, "w") as f:
+            json.dump({"repeat": repeat, "results": results}, f, indent = 2)
+        print("Wrote " + output)
+    if (failed > 0):
+        sys.exit(1)
+
+if (__name__ == "__main__"):
+    main()
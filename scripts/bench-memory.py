@@ -0,0 +1,45 @@
+#
+# Call as follows
+#
+#   python3 scripts/bench-memory.py file.nc [anotherfile.nc ...]
+#
+# Measures the memory footprint of the hourly table that show-data.py
+# reads with --full, per site-year of data, in three representations:
+# the original one (float64 columns and "YYYY/MM/DD" and "HH:MM:SS"
+# columns of Python strings on every row), the current default one
+# (float64 columns and a datetime index), and the compact one (float32
+# columns and a datetime index, the --compact option).
+#
+
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import caveweather
+
+def footprint(df):
+    return(int(df.memory_usage(deep = True, index = True).sum()))
+
+def original(df):
+    result = df.astype(np.float64).reset_index(drop = True)
+    result["date"] = df.index.strftime("%Y/%m/%d").astype(object)
+    result["time"] = df.index.strftime("%H:%M:%S").astype(object)
+    return(result)
+
+def main():
+    file_names = sys.argv[1:]
+    if (len(file_names) == 0):
+        print("Usage: python3 scripts/bench-memory.py file.nc [anotherfile.nc ...]")
+        sys.exit(1)
+    compact = caveweather.load(file_names, compact = 1)
+    default = caveweather.load(file_names)
+    siteyears = len(compact.index) / (365.25 * 24)
+    print("rows " + str(len(compact.index)) + ", site-years " + "%.2f" % siteyears)
+    for (name, df) in [("original", original(default)), ("default", default), ("compact", compact)]:
+        size = footprint(df)
+        print("%-10s %12d bytes %10.1f KiB per site-year" % (name, size, size / siteyears / 1024))
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,289 @@
+#
+# Call as follows
+#
+#   python3 scripts/bench-suite.py [options]
+#
+# Runs the show-data.py benchmarks on synthetic data, without access to
+# CDS. Yearly netCDF files like those written by pull-data.py are first
+# generated for one site, and then the reading of the hourly data, the
+# daily aggregation of every mode, text and CSV output, and plotting
+# are timed for inputs of increasing numbers of site-years. The results
+# are printed, and written as JSON for comparison with later runs.
+#
+# The possible options are:
+#
+#   --dir dir              Keep the generated files in directory 'dir'.
+#                          The default is bench-data. Files already
+#                          there are reused.
+#   --site-years n ...     Sizes of the inputs to time, in site-years.
+#                          The default is 1 5 10 25 50.
+#   --repeat n             Run each benchmark n times and take the
+#                          fastest run. The default is 1.
+#   --output file.json     Write the results to the given file. The
+#                          default is bench-results.json.
+#   --compare file.json    Compare the results to earlier ones, and exit
+#                          with status 1 if any benchmark got slower by
+#                          more than the tolerance.
+#   --tolerance x          Allowed slowdown as a fraction, the default
+#                          is 0.25, i.e., 25%.
+#   --generate-only        Only generate the input files.
+#
+
+import sys
+import os
+import json
+import time
+import platform
+import calendar
+from datetime import datetime
+import numpy as np
+import netCDF4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import caveweather
+from caveweather.showdata import modecolumns, invalid1, invalid2, invalid3, invalid4
+
+#
+# Synthetic data. Each variable is made of a seasonal and a daily cycle
+# and noise. The cycles peak at the start of July and at noon UTC;
+# evaporation is negative, so its cycles are too, and snow depth only
+# follows the winter half of the seasonal cycle, peaking at the turn
+# of the year. The values are packed into int16 with a scale factor
+# and offset, as in CDS output. Temperature has some hours missing
+# (_FillValue), and the accumulated variables have some hours set to
+# the tiny invalid values that show-data.py cleans up. Each of these
+# variables is packed with one of the invalid values as its offset, so
+# that the packed value zero decodes to exactly that value (and is
+# cleaned up by show-data.py): the invalid hours, and any other values
+# nearest to zero, are written as packed zeros.
+#
+
+firstyear = 1980
+latitude = 69.25
+longitude = 21.5
+
+syntheticvariables = [
+    # name, units, long_name, mean, seasonal, daily, noise
+    ("t2m",  "K",                     "2 metre temperature",      272.0,   12.0,    4.0,    3.0),
+    ("cp",   "m",                     "Convective precipitation", 0.0001,  0.00005, 0.0,    0.0003),
+    ("ro",   "m",                     "Runoff",                   0.00012, 0.0001,  0.0,    0.00005),
+    ("sro",  "m",                     "Surface runoff",           0.00006, 0.00005, 0.0,    0.00003),
+    ("ssro", "m",                     "Sub-surface runoff",       0.00006, 0.00005, 0.0,    0.00002),
+    ("mror", "kg m**-2 s**-1",        "Mean runoff rate",         0.00003, 0.00002, 0.0,    0.00001),
+    ("e",    "m of water equivalent", "Evaporation",              -0.0001, -0.00008, -0.00005, 0.00003),
+    ("es",   "m of water equivalent", "Snow evaporation",         -0.00001, -0.00001, 0.0,    0.000005),
+    ("sd",   "m of water equivalent", "Snow depth",               0.1,     0.1,     0.0,    0.005)
+]
+
+nonnegative = ["cp", "ro", "sro", "ssro", "mror", "sd"]
+invalids = {
+    "cp"   : invalid1,
+    "ro"   : invalid2,
+    "sro"  : invalid3,
+    "ssro" : invalid4,
+    "e"    : invalid1,
+    "es"   : invalid2
+}
+
+def generate(file_location, year, seed = 0):
+    base = datetime(1900, 1, 1)
+    h0 = int((datetime(year, 1, 1) - base).total_seconds()) // 3600
+    n = (366 if calendar.isleap(year) else 365) * 24
+    hours = np.arange(h0, h0 + n)
+    rng = np.random.default_rng(seed * 10000 + year)
+    f = netCDF4.Dataset(file_location, "w")
+    f.Conventions = "CF-1.6"
+    f.history = "Synthetic ERA5-like data for benchmarks"
+    f.createDimension("longitude", 1)
+    f.createDimension("latitude", 1)
+    f.createDimension("time", None)
+    lon = f.createVariable("longitude", "f4", ("longitude",))
+    lon.units = "degrees_east"
+    lon.long_name = "longitude"
+    lon[:] = [longitude]
+    lat = f.createVariable("latitude", "f4", ("latitude",))
+    lat.units = "degrees_north"
+    lat.long_name = "latitude"
+    lat[:] = [latitude]
+    chunk = min(n, 8784)
+    timevar = f.createVariable("time", "i4", ("time",), chunksizes = [chunk])
+    timevar.units = "hours since 1900-01-01 00:00:00.0"
+    timevar.long_name = "time"
+    timevar.calendar = "gregorian"
+    timevar[:] = hours
+    season = -np.cos(2 * np.pi * (hours % 8766) / 8766)
+    day = -np.cos(2 * np.pi * (hours % 24) / 24)
+    for (name, units, long_name, mean, seasonal, daily, noise) in syntheticvariables:
+        if (name == "sd"):
+            data = mean + seasonal * np.maximum(-season, 0) + noise * rng.standard_normal(n)
+        else:
+            data = mean + seasonal * season + daily * day + noise * rng.standard_normal(n)
+        if (name in nonnegative):
+            data = np.maximum(data, 0)
+        (lo, hi) = (data.min(), data.max())
+        if (name in invalids):
+            bad = rng.random(n) < 0.05
+            data[bad] = invalids[name]
+            offset = invalids[name]
+            scale = max(abs(lo), abs(hi)) / 32760 if hi > lo else 1e-9
+        else:
+            offset = (hi + lo) / 2
+            scale = (hi - lo) / 65530 if hi > lo else 1e-9
+        var = f.createVariable(name, "i2", ("time", "latitude", "longitude"), fill_value = np.int16(-32767),
+                               chunksizes = [chunk, 1, 1])
+        var.scale_factor = scale
+        var.add_offset = offset
+        var.missing_value = np.int16(-32767)
+        var.units = units
+        var.long_name = long_name
+        packed = np.ma.masked_array(data.reshape(n, 1, 1))
+        if (name == "t2m"):
+            packed[rng.random(n) < 0.001] = np.ma.masked
+        var[:] = packed
+    f.close()
+    return(file_location)
+
+def generatefiles(directory, count):
+    os.makedirs(directory, exist_ok = True)
+    result = []
+    for year in range(firstyear, firstyear + count):
+        file_location = os.path.join(directory, "data-" + str(year) + "-" + str(year) + ".nc")
+        if (not os.path.exists(file_location)):
+            generate(file_location + ".tmp", year)
+            os.replace(file_location + ".tmp", file_location)
+        result.append(file_location)
+    return(result)
+
+#
+# The benchmarks. Each takes its input (the input files, the hourly
+# data loaded from them, or the daily data aggregated from them), and
+# returns the number of rows it processed. Only the benchmark itself is
+# timed, not the preparation of its input.
+#
+
+def benchload(files):
+    return(len(caveweather.load(files).index))
+
+def benchaggregate(mode):
+    def run(files):
+        return(len(caveweather.aggregate(files, mode).index))
+    return(run)
+
+def benchwrite(outputformat):
+    def run(data):
+        with open(os.devnull, "w") as out:
+            caveweather.write(data, out, outputformat)
+        return(len(data.index))
+    return(run)
+
+def benchplot(file_location):
+    def run(data):
+        caveweather.plot(data, file_location)
+        return(len(data.index))
+    return(run)
+
+def benchmarks(directory):
+    result = [("load", "files", benchload)]
+    for mode in modecolumns:
+        result.append(("aggregate-" + mode, "files", benchaggregate(mode)))
+    result.append(("write-csv", "daily", benchwrite("csv")))
+    result.append(("write-text", "daily", benchwrite("text")))
+    result.append(("write-full-csv", "hourly", benchwrite("csv")))
+    result.append(("write-full-text", "hourly", benchwrite("text")))
+    result.append(("plot-png", "daily", benchplot(os.path.join(directory, "bench-plot.png"))))
+    result.append(("plot-svg", "daily", benchplot(os.path.join(directory, "bench-plot.svg"))))
+    return(result)
+
+def runbenchmark(function, files, repeat):
+    best = None
+    rows = 0
+    for i in range(repeat):
+        start = time.perf_counter()
+        rows = function(files)
+        seconds = time.perf_counter() - start
+        if (best is None or seconds < best):
+            best = seconds
+    return(best, rows)
+
+def compare(results, file_location, tolerance):
+    with open(file_location) as f:
+        earlier = json.load(f)
+    before = dict([((r["benchmark"], r["siteyears"]), r["seconds"]) for r in earlier["results"]])
+    slower = 0
+    for r in results:
+        key = (r["benchmark"], r["siteyears"])
+        if (key in before and r["seconds"] > before[key] * (1 + tolerance)):
+            print("Slower: %s at %d site-years, %.3f s vs %.3f s" %
+                  (r["benchmark"], r["siteyears"], r["seconds"], before[key]))
+            slower = slower + 1
+    return(slower)
+
+def main():
+    directory = "bench-data"
+    siteyears = [1, 5, 10, 25, 50]
+    repeat = 1
+    output = "bench-results.json"
+    comparefile = ""
+    tolerance = 0.25
+    generateonly = 0
+    argv = sys.argv[1:]
+    i = 0
+    while (i < len(argv)):
+        opt = argv[i]
+        if (opt == "--dir"):
+            directory = argv[i+1]
+            i = i + 2
+        elif (opt == "--site-years"):
+            siteyears = []
+            i = i + 1
+            while (i < len(argv) and argv[i][0] != '-'):
+                siteyears.append(int(argv[i]))
+                i = i + 1
+        elif (opt == "--repeat"):
+            repeat = int(argv[i+1])
+            i = i + 2
+        elif (opt == "--output"):
+            output = argv[i+1]
+            i = i + 2
+        elif (opt == "--compare"):
+            comparefile = argv[i+1]
+            i = i + 2
+        elif (opt == "--tolerance"):
+            tolerance = float(argv[i+1])
+            i = i + 2
+        elif (opt == "--generate-only"):
+            generateonly = 1
+            i = i + 1
+        else:
+            print("Unrecognised option " + opt)
+            sys.exit(1)
+    files = generatefiles(directory, max(siteyears))
+    if (generateonly):
+        return
+    results = []
+    for n in siteyears:
+        inputs = {
+            "files"  : files[:n],
+            "hourly" : caveweather.load(files[:n]),
+            "daily"  : caveweather.aggregate(files[:n])
+        }
+        for (name, kind, function) in benchmarks(directory):
+            (seconds, rows) = runbenchmark(function, inputs[kind], repeat)
+            results.append({"benchmark": name, "siteyears": n, "rows": rows, "seconds": seconds})
+            print("%-28s %4d site-years %9d rows %9.3f s" % (name, n, rows, seconds))
+    summary = {
+        "created"  : datetime.now().isoformat(timespec = "seconds"),
+        "python"   : platform.python_version(),
+        "platform" : platform.platform(),
+        "repeat"   : repeat,
+        "results"  : results
+    }
+    with open(output, "w") as f:
+        json.dump(summary, f, indent = 2)
+    print("Wrote " + output)
+    if (comparefile != "" and compare(results, comparefile, tolerance) > 0):
+        sys.exit(1)
+
+if (__name__ == "__main__"):
+    main()
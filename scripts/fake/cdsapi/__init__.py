@@ -0,0 +1,231 @@
+#
+# An offline stand-in for the cdsapi module, used by test-pull.py. Put
+# the directory above this one first in PYTHONPATH to use it. Requests
+# are answered with synthetic ERA5-like netCDF files for the asked
+# years, months, days, variables, and area (the points of a 0.25 degree
+# grid inside it, or the nearest one to a point), with int16 packed
+# values as in CDS output. Results are downloaded through the client,
+# or, if FAKECDS_URL is set, published for download over HTTP, as with
+# the legacy CDS API (see test-pull.py for the server). Requests queued
+# by an earlier run can be continued through cdsapi.api.Result.
+#
+# The fake is controlled by environment variables:
+#
+#   FAKECDS_DIR            Directory where the requests are recorded, one
+#                          JSON file per request, and where every call
+#                          is logged to the file 'log', one line per
+#                          call. Required.
+#   FAKECDS_FAIL           Comma-separated years whose requests fail.
+#   FAKECDS_DELAY          Seconds each request takes, the default is 0.
+#   FAKECDS_POLLS          In asynchronous mode (wait_until_complete is
+#                          False), the number of polls for which a
+#                          request stays queued, and then running,
+#                          before it completes or fails. The default
+#                          is 1.
+#   FAKECDS_URL            Base URL of an HTTP server serving the files in
+#                          FAKECDS_DIR/files. Completed results are
+#                          written there, and their URL and size are
+#                          given as their location and content_length.
+#
+
+import os
+import json
+import time
+import calendar
+import threading
+from datetime import datetime
+import numpy as np
+import netCDF4
+
+lock = threading.Lock()
+
+#
+# The netCDF library is not thread-safe, so files are written one at a
+# time
+#
+
+netcdflock = threading.Lock()
+
+shortnames = {
+    "2m_temperature"           : "t2m",
+    "convective_precipitation" : "cp",
+    "runoff"                   : "ro",
+    "sub_surface_runoff"       : "ssro",
+    "surface_runoff"           : "sro",
+    "mean_runoff_rate"         : "mror",
+    "evaporation"              : "e",
+    "snow_evaporation"         : "es",
+    "snow_depth"               : "sd"
+}
+
+def fakedir():
+    return(os.environ["FAKECDS_DIR"])
+
+def log(*words):
+    with lock:
+        with open(os.path.join(fakedir(), "log"), "a") as f:
+            f.write(" ".join([str(word) for word in words]) + "\n")
+
+def failing(request):
+    years = [year for year in os.environ.get("FAKECDS_FAIL", "").split(",") if year != ""]
+    return(any([str(year) in years for year in request["year"]]))
+
+#
+# Requests are numbered in the order they are made, over all runs
+# using the same FAKECDS_DIR. Removing the file of a request makes it
+# unknown.
+#
+
+def newrequest(request):
+    with lock:
+        numbers = [int(name[5:-5]) for name in os.listdir(fakedir())
+                   if name.startswith("fake-") and name.endswith(".json")]
+        request_id = "fake-" + str(max(numbers + [0]) + 1)
+        with open(os.path.join(fakedir(), request_id + ".json"), "w") as f:
+            json.dump({"request": request, "polls": 0}, f)
+    return(request_id)
+
+def loadrequest(request_id):
+    with lock:
+        with open(os.path.join(fakedir(), request_id + ".json")) as f:
+            return(json.load(f))
+
+#
+# Poll a request, moving it from queued to running to completed (or
+# failed) as it is polled
+#
+
+def pollrequest(request_id):
+    if (not os.path.exists(os.path.join(fakedir(), request_id + ".json"))):
+        raise RuntimeError("Request " + request_id + " is not known to the fake CDS")
+    with lock:
+        with open(os.path.join(fakedir(), request_id + ".json")) as f:
+            record = json.load(f)
+        record["polls"] = record["polls"] + 1
+        with open(os.path.join(fakedir(), request_id + ".json"), "w") as f:
+            json.dump(record, f)
+    polls = int(os.environ.get("FAKECDS_POLLS", "1"))
+    if (record["polls"] <= polls):
+        return("queued")
+    if (record["polls"] <= 2 * polls):
+        return("running")
+    if (failing(record["request"])):
+        return("failed")
+    return("completed")
+
+#
+# The hours of a request, as hours since 1900, in time order
+#
+
+def requesthours(request):
+    base = datetime(1900, 1, 1)
+    hours = []
+    for year in request["year"]:
+        for month in request["month"]:
+            days = calendar.monthrange(int(year), int(month))[1]
+            for day in request["day"]:
+                if (int(day) > days):
+                    continue
+                start = int((datetime(int(year), int(month), int(day)) - base).total_seconds()) // 3600
+                hours.extend(range(start, start + 24))
+    return(np.array(sorted(hours)))
+
+def gridpoints(low, high):
+    points = np.arange(np.ceil(low * 4) / 4, np.floor(high * 4) / 4 + 0.01, 0.25)
+    if (len(points) == 0):
+        points = np.array([np.round((low + high) * 2) / 4])
+    return(points)
+
+def writedata(request, file_location):
+    hours = requesthours(request)
+    (north, west, south, east) = [float(x) for x in request["area"].split("/")]
+    latitudes = gridpoints(south, north)[::-1]
+    longitudes = gridpoints(west, east)
+    f = netCDF4.Dataset(file_location, "w")
+    f.createDimension("longitude", len(longitudes))
+    f.createDimension("latitude", len(latitudes))
+    f.createDimension("time", len(hours))
+    f.createVariable("longitude", "f4", ("longitude",))[:] = longitudes
+    f.createVariable("latitude", "f4", ("latitude",))[:] = latitudes
+    timevar = f.createVariable("time", "i4", ("time",))
+    timevar.units = "hours since 1900-01-01 00:00:00.0"
+    timevar.calendar = "gregorian"
+    timevar[:] = hours
+    for (k, variable) in enumerate(request["variable"]):
+        name = shortnames[variable]
+        mean = 270.0 if name == "t2m" else 0.0
+        amplitude = 10.0 if name == "t2m" else 0.0001
+        data = mean + amplitude * np.sin(hours / 24.0 + k)
+        data = data[:, None, None] + 0.01 * latitudes[None, :, None] + 0.01 * longitudes[None, None, :]
+        (lo, hi) = (data.min(), data.max())
+        var = f.createVariable(name, "i2", ("time", "latitude", "longitude"), fill_value = np.int16(-32767))
+        var.scale_factor = (hi - lo) / 65000 if hi > lo else 1e-9
+        var.add_offset = (hi + lo) / 2
+        var.missing_value = np.int16(-32767)
+        var[:] = data
+    f.close()
+
+#
+# Publish the result of a completed request for download over HTTP
+#
+
+def publish(reply):
+    if (os.environ.get("FAKECDS_URL", "") == "" or "location" in reply):
+        return
+    os.makedirs(os.path.join(fakedir(), "files"), exist_ok = True)
+    name = reply["request_id"] + ".nc"
+    file_location = os.path.join(fakedir(), "files", name)
+    with netcdflock:
+        writedata(loadrequest(reply["request_id"])["request"], file_location)
+    reply["location"] = os.environ["FAKECDS_URL"] + "/" + name
+    reply["content_length"] = os.path.getsize(file_location)
+
+#
+# The result of a request, downloaded through the client. Its state is
+# updated by polling; polling a request that is not known fails.
+#
+
+class Result:
+    def __init__(self, client, reply):
+        self.client = client
+        self.reply = reply
+
+    @property
+    def location(self):
+        return(self.reply["location"])
+
+    @property
+    def content_length(self):
+        return(self.reply["content_length"])
+
+    def update(self):
+        self.reply["state"] = pollrequest(self.reply["request_id"])
+        log("update", self.reply["request_id"], self.reply["state"])
+        if (self.reply["state"] == "completed"):
+            publish(self.reply)
+
+    def download(self, target = None):
+        request = loadrequest(self.reply["request_id"])["request"]
+        log("download", self.reply["request_id"])
+        with netcdflock:
+            writedata(request, target)
+        return(target)
+
+class Client:
+    def __init__(self, wait_until_complete = True, **kwargs):
+        self.wait_until_complete = wait_until_complete
+        log("client", id(self))
+
+    def retrieve(self, name, request, target = None):
+        time.sleep(float(os.environ.get("FAKECDS_DELAY", "0")))
+        request_id = newrequest(request)
+        log("retrieve", request_id, ",".join(request["year"]), ",".join(request["month"]))
+        if (not self.wait_until_complete):
+            return(Result(self, {"request_id": request_id, "state": "queued"}))
+        if (failing(request)):
+            raise RuntimeError("Request " + request_id + " failed at the fake CDS")
+        result = Result(self, {"request_id": request_id, "state": "completed"})
+        publish(result.reply)
+        if (target is not None):
+            result.download(target)
+        return(result)
@@ -0,0 +1,6 @@
+#
+# The cdsapi.api module of the fake, through which pull-data.py
+# continues the requests queued by an earlier run
+#
+
+from cdsapi import Client, Result
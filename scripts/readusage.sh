@@ -27,4 +27,17 @@ echo "# SHOW-DATA"
 echo ""
 awk -f $AWKSCRIPT < $SHOWSCRIPT
 echo ""
+echo "# LIBRARY"
+echo ""
+echo "Both commands are thin wrappers over the caveweather package in the src"
+echo "directory, which can also be imported to process many sites in one"
+echo "Python process. It provides the functions pull, pullsites, and update"
+echo "for pulling data, and load, aggregate, write, convert, and plot for"
+echo "reading, summarizing, and writing it out. For instance:"
+echo ""
+echo "    import caveweather"
+echo "    files = caveweather.pull([2019, 2020], latitude = 69.23, longitude = 21.42)"
+echo "    daily = caveweather.aggregate(caveweather.load(files), \"temperature\")"
+echo "    caveweather.write(daily, \"temperature.csv\", format = \"csv\")"
+echo ""
 
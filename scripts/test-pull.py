@@ -0,0 +1,457 @@
+#
+# Call as follows
+#
+#   python3 scripts/test-pull.py [options] [check ...]
+#
+# Runs pull-data.py against the offline stand-in for cdsapi in
+# scripts/fake, without access to CDS, and checks the files written and
+# the requests made. Each check runs the command in a fresh directory.
+# The checks of resumed pulls also serve the results from a local HTTP
+# server, which can cut downloads off in the middle or answer that a
+# result has expired, as CDS does.
+# Without arguments all checks are run; otherwise only the named ones.
+# Exits with status 1 if any check fails.
+#
+# The possible options are:
+#
+#   --keep dir             Run the checks in subdirectories of 'dir' and
+#                          keep them. By default a temporary directory
+#                          is used and removed.
+#   --verbose              Print the output of the commands.
+#
+
+import sys
+import os
+import shutil
+import tempfile
+import json
+import time
+import signal
+import threading
+import subprocess
+import http.server
+import numpy as np
+import netCDF4
+
+scripts = os.path.dirname(os.path.abspath(__file__))
+pulldata = os.path.join(scripts, "..", "src", "pull-data.py")
+fake = os.path.join(scripts, "fake")
+timeout = 300 # seconds
+verbose = 0
+
+class CheckFailed(Exception):
+    pass
+
+def expect(condition, message):
+    if (not condition):
+        raise CheckFailed(message)
+
+#
+# Run pull-data.py in directory 'work' with the fake cdsapi, which
+# records its requests in work/fake. Returns the exit status and the
+# output of the command. A run started with start() can be stopped
+# before it finishes; its output is written to work/output.
+#
+
+def environment(work, fakeenv):
+    os.makedirs(os.path.join(work, "fake"), exist_ok = True)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = fake + os.pathsep + env.get("PYTHONPATH", "")
+    env["FAKECDS_DIR"] = os.path.join(work, "fake")
+    env.update(fakeenv)
+    return(env)
+
+def run(work, args, **fakeenv):
+    try:
+        process = subprocess.run([sys.executable, pulldata] + args, cwd = work, env = environment(work, fakeenv),
+                                 stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                 universal_newlines = True, timeout = timeout)
+    except subprocess.TimeoutExpired:
+        raise CheckFailed("pull-data.py " + " ".join(args) + " did not finish in " + str(timeout) + " s")
+    if (verbose):
+        print(process.stdout)
+    return(process.returncode, process.stdout)
+
+def start(work, args, **fakeenv):
+    output = open(os.path.join(work, "output"), "w")
+    process = subprocess.Popen([sys.executable, pulldata] + args, cwd = work, env = environment(work, fakeenv),
+                               stdout = output, stderr = subprocess.STDOUT)
+    output.close()
+    return(process)
+
+def stop(process):
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+
+#
+# A local HTTP server for the results the fake publishes in
+# work/fake/files. The first 'cuts' downloads of files larger than
+# 'cutat' bytes send only that many bytes and then close the
+# connection, and the first 'expire' downloads are answered with 410
+# Gone. Range requests get the rest of the file. Every request is
+# recorded as (file name, first byte asked for, HTTP status).
+#
+
+class ResultHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        name = os.path.basename(self.path)
+        file_location = os.path.join(server.directory, name)
+        first = 0
+        if (self.headers.get("Range") is not None):
+            first = int(self.headers["Range"].split("=")[1].split("-")[0])
+        cut = 0
+        with server.lock:
+            if (not os.path.exists(file_location)):
+                status = 404
+            elif (server.expire > 0):
+                server.expire = server.expire - 1
+                status = 410
+            else:
+                status = 206 if first > 0 else 200
+                if (server.cuts > 0 and os.path.getsize(file_location) - first > server.cutat):
+                    server.cuts = server.cuts - 1
+                    cut = 1
+            server.requests.append((name, first, status))
+        if (status not in [200, 206]):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with open(file_location, "rb") as f:
+            data = f.read()
+        self.send_response(status)
+        if (status == 206):
+            self.send_header("Content-Range", "bytes " + str(first) + "-" + str(len(data)-1) + "/" + str(len(data)))
+        self.send_header("Content-Length", str(len(data) - first))
+        self.end_headers()
+        if (cut):
+            self.wfile.write(data[first:first + server.cutat])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[first:])
+
+def startserver(work, cuts = 0, cutat = 70000, expire = 0):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ResultHandler)
+    server.directory = os.path.join(work, "fake", "files")
+    server.lock = threading.Lock()
+    server.cuts = cuts
+    server.cutat = cutat
+    server.expire = expire
+    server.requests = []
+    server.url = "http://127.0.0.1:" + str(server.server_address[1])
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return(server)
+
+def stopserver(server):
+    server.shutdown()
+    server.server_close()
+
+#
+# The calls logged by the fake, as lists of words
+#
+
+def calls(work, kind = None):
+    with open(os.path.join(work, "fake", "log")) as f:
+        result = [line.split() for line in f]
+    if (kind is None):
+        return(result)
+    return([call for call in result if call[0] == kind])
+
+#
+# Check that a file has an hourly time axis without gaps or duplicates
+# from 'first' to 'last', inclusive
+#
+
+def expecthours(file_location, first, last):
+    expect(os.path.exists(file_location), file_location + " was not written")
+    f = netCDF4.Dataset(file_location)
+    timevar = f.variables['time']
+    times = netCDF4.num2date(timevar[:], timevar.units, getattr(timevar, 'calendar', 'standard'),
+                             only_use_cftime_datetimes = False, only_use_python_datetimes = True)
+    f.close()
+    times = np.array(times, dtype = "datetime64[s]")
+    expect(len(times) > 0, file_location + " has no hours")
+    expect(times[0] == np.datetime64(first), file_location + " starts at " + str(times[0]))
+    expect(times[len(times)-1] == np.datetime64(last), file_location + " ends at " + str(times[len(times)-1]))
+    steps = np.diff(times).astype(np.int64)
+    expect((steps == 3600).all(), file_location + " is not hourly without gaps: steps " + str(sorted(set(steps.tolist()))))
+
+#
+# Chunked pulls, merged into one file
+#
+
+def checkchunkyear(work):
+    (status, output) = run(work, ["--no-cache", "--jobs", "3", "--chunk", "year", "2019", "2021"])
+    expect(status == 0, "pull failed")
+    expecthours(os.path.join(work, "data-2019-2021.nc"), "2019-01-01T00:00", "2021-12-31T23:00")
+    requested = calls(work, "retrieve")
+    expect(all([len(call[2].split(",")) == 1 for call in requested]), "a request spans several years")
+    expect(sorted(set([call[2] for call in requested])) == ["2019", "2020", "2021"], "not every year was requested")
+    expect(not os.path.exists(os.path.join(work, "data-2019-2021.nc.state")), "the state file was left")
+
+def checkchunkmonth(work):
+    (status, output) = run(work, ["--no-cache", "--jobs", "2", "--chunk", "month", "--months", "02", "04", "2020"])
+    expect(status == 0, "pull failed")
+    expecthours(os.path.join(work, "data-2020-2020-02-04.nc"), "2020-02-01T00:00", "2020-04-30T23:00")
+    requested = calls(work, "retrieve")
+    expect(sorted([call[3] for call in requested]) == ["02", "03", "04"], "not one request per month")
+
+def checkchunkfailure(work):
+    (status, output) = run(work, ["--no-cache", "--jobs", "2", "--chunk", "year", "--retries", "0", "2019", "2020"],
+                           FAKECDS_FAIL = "2020")
+    expect(status == 1, "pull with a failing chunk exited with status " + str(status))
+    failures = [line.split()[1] for line in output.splitlines()
+                if line.startswith("Chunk ") and " failed " in line]
+    expect(len(failures) > 0, "the failing chunk was not reported")
+    expect(all([name.startswith("2020") for name in failures]), "chunks of 2019 failed")
+    listed = [line for line in output.splitlines() if line.startswith("Fatal error: Failed chunks: ")]
+    expect(len(listed) == 1 and sorted(listed[0].split(";")[0].split()[4:]) == sorted(failures),
+           "the failed chunks were not listed")
+    expect(not os.path.exists(os.path.join(work, "data-2019-2020.nc")), "an incomplete file was written")
+
+#
+# Asynchronous pulls: every request is queued before any is polled,
+# all of them through the one client, and requests are downloaded as
+# they complete. A request that disappears while it is polled is
+# queued again on retry.
+#
+
+def checkasync(work):
+    (status, output) = run(work, ["--no-cache", "--async", "--jobs", "2", "2019", "2020"])
+    expect(status == 0, "pull failed")
+    expecthours(os.path.join(work, "data-2019-2020.nc"), "2019-01-01T00:00", "2020-12-31T23:00")
+    log = calls(work)
+    retrieves = [k for (k, call) in enumerate(log) if call[0] == "retrieve"]
+    updates = [k for (k, call) in enumerate(log) if call[0] == "update"]
+    expect(len(retrieves) > 0 and len(updates) > 0, "no requests were queued and polled")
+    expect(max(retrieves) < min(updates), "a request was polled before all were queued")
+    expect(len(calls(work, "client")) == 1, "more than one client was created")
+    for call in calls(work, "retrieve"):
+        states = [update[2] for update in calls(work, "update") if update[1] == call[1]]
+        expect(states == ["queued", "running", "completed"], "request " + call[1] + " went through " + str(states))
+    expect(len(calls(work, "download")) == len(calls(work, "retrieve")), "not every result was downloaded")
+    expect("is queued" in output and "is running" in output, "the states of the requests were not reported")
+
+def checkasyncfailure(work):
+    (status, output) = run(work, ["--no-cache", "--async", "--jobs", "2", "--retries", "1", "--retry-delay", "0",
+                                  "2019", "2020"], FAKECDS_FAIL = "2020")
+    expect(status == 1, "pull with failing requests exited with status " + str(status))
+    expect(len(calls(work, "client")) == 1, "more than one client was created")
+    requested = calls(work, "retrieve")
+    expect(len([call for call in requested if call[2] == "2019"]) * 2 ==
+           len([call for call in requested if call[2] == "2020"]), "the failed requests were not retried once")
+    expect("is failed" in output, "the failed requests were not reported")
+    expect(not os.path.exists(os.path.join(work, "data-2019-2020.nc")), "an incomplete file was written")
+
+def checkasynclost(work):
+    args = ["--no-cache", "--async", "--retries", "1", "--retry-delay", "0", "2019", "2020"]
+    process = start(work, args, FAKECDS_POLLS = "3")
+    deadline = time.time() + timeout
+    try:
+        while (not os.path.exists(os.path.join(work, "fake", "log")) or len(calls(work, "update")) == 0):
+            expect(time.time() < deadline and process.poll() is None, "no request was polled")
+            time.sleep(0.1)
+        lost = calls(work, "retrieve")[0][1]
+        os.remove(os.path.join(work, "fake", lost + ".json"))
+        status = process.wait(timeout = max(deadline - time.time(), 1))
+    except subprocess.TimeoutExpired:
+        raise CheckFailed("pull with a lost request did not finish in " + str(timeout) + " s")
+    finally:
+        if (process.poll() is None):
+            stop(process)
+    with open(os.path.join(work, "output")) as f:
+        output = f.read()
+    if (verbose):
+        print(output)
+    expect(status == 0, "pull with a lost request exited with status " + str(status))
+    expect("could not be polled" in output, "the failed polls were not reported")
+    requested = calls(work, "retrieve")
+    expect(len(requested) == len(set([(call[2], call[3]) for call in requested])) + 1,
+           "the lost request was not queued again once")
+    expecthours(os.path.join(work, "data-2019-2020.nc"), "2019-01-01T00:00", "2020-12-31T23:00")
+
+#
+# Sites pulled together in one area, each written with its nearest
+# grid cell
+#
+
+def checksites(work):
+    with open(os.path.join(work, "sites.csv"), "w") as f:
+        f.write("name,latitude,longitude\nCave A,69.0,21.0\nCave B,69.63,21.4\n")
+    (status, output) = run(work, ["--no-cache", "--sites", "sites.csv", "--month", "01", "2019"])
+    expect(status == 0, "pull failed")
+    expect(len(calls(work, "retrieve")) == 1, "the sites were not pulled together")
+    for (name, latitude, longitude) in [("Cave_A", 69.0, 21.0), ("Cave_B", 69.75, 21.5)]:
+        file_location = os.path.join(work, "data-" + name + "-2019-2019-01.nc")
+        expecthours(file_location, "2019-01-01T00:00", "2019-01-31T23:00")
+        f = netCDF4.Dataset(file_location)
+        cell = (float(f.variables['latitude'][0]), float(f.variables['longitude'][0]))
+        f.close()
+        expect(cell == (latitude, longitude), name + " got the grid cell at " + str(cell))
+    with open(os.path.join(work, "clash.csv"), "w") as f:
+        f.write("Cave A,69.0,21.0\nCave_A,69.63,21.4\n")
+    (status, output) = run(work, ["--no-cache", "--sites", "clash.csv", "--month", "01", "2019"])
+    expect(status == 1 and "Cave_A" in output, "sites with the same file name were accepted")
+
+#
+# Resumed pulls. A rerun uses the results recorded in <output>.state
+# by a failed run instead of requesting them again, continues a cut
+# download from where it stopped, and requests a result again if it
+# has expired. A rerun of an asynchronous pull that was killed polls
+# the requests queued by it, and only queues again those that CDS does
+# not know anymore.
+#
+
+def checkresumestate(work):
+    server = startserver(work)
+    try:
+        args = ["--no-cache", "--jobs", "2", "--chunk", "year", "--retries", "0", "2019", "2020"]
+        (status, output) = run(work, args, FAKECDS_FAIL = "2020", FAKECDS_URL = server.url)
+        expect(status == 1, "pull with a failing chunk exited with status " + str(status))
+        expect(os.path.exists(os.path.join(work, "data-2019-2020.nc.state")), "no state file was left")
+        first = len(calls(work, "retrieve"))
+        (status, output) = run(work, args, FAKECDS_URL = server.url)
+        expect(status == 0, "rerun failed")
+        again = calls(work, "retrieve")[first:]
+        expect(len(again) > 0 and all([call[2] == "2020" for call in again]), "the rerun requested " +
+               " ".join([call[2] for call in again]))
+        earlier = [line.split()[1] for line in output.splitlines() if line.endswith(" was downloaded earlier")]
+        expect(len(earlier) == first - len(again) and all([name.startswith("2019") for name in earlier]),
+               "the rerun did not use the earlier downloads")
+        expecthours(os.path.join(work, "data-2019-2020.nc"), "2019-01-01T00:00", "2020-12-31T23:00")
+        expect(not os.path.exists(os.path.join(work, "data-2019-2020.nc.state")), "the state file was left")
+        expect(len([name for name in os.listdir(work) if ".part" in name]) == 0, "partial files were left")
+    finally:
+        stopserver(server)
+
+def checkrangeresume(work):
+    server = startserver(work, cuts = 1)
+    try:
+        args = ["--no-cache", "--chunk", "none", "--retries", "0", "2019", "2020"]
+        (status, output) = run(work, args, FAKECDS_URL = server.url)
+        expect(status == 1, "pull with a cut download exited with status " + str(status))
+        first = len(calls(work, "retrieve"))
+        (status, output) = run(work, args, FAKECDS_URL = server.url)
+        expect(status == 0, "rerun failed")
+        expect(len(calls(work, "retrieve")) == first, "the rerun made requests again")
+        expect(len([request for request in server.requests if request[1] == 64 * 1024 and request[2] == 206]) == 1,
+               "the cut download was not continued with a range request: " + str(server.requests))
+        expect("Continuing the download" in output, "the continued download was not reported")
+        expecthours(os.path.join(work, "data-2019-2020.nc"), "2019-01-01T00:00", "2020-12-31T23:00")
+    finally:
+        stopserver(server)
+
+def checkexpired(work):
+    server = startserver(work, expire = 1)
+    try:
+        (status, output) = run(work, ["--no-cache", "--chunk", "year", "--retries", "1", "--retry-delay", "0",
+                                      "2019", "2020"], FAKECDS_URL = server.url)
+        expect(status == 0, "pull failed")
+        expect("has expired" in output, "the expired result was not reported")
+        expect(len([request for request in server.requests if request[2] == 410]) == 1, "no result expired")
+        requested = calls(work, "retrieve")
+        expect(len(requested) == len(set([(call[2], call[3]) for call in requested])) + 1,
+               "the expired result was not requested again once")
+        expecthours(os.path.join(work, "data-2019-2020.nc"), "2019-01-01T00:00", "2020-12-31T23:00")
+    finally:
+        stopserver(server)
+
+def checkreattach(work):
+    server = startserver(work)
+    try:
+        args = ["--no-cache", "--async", "--chunk", "year", "2018", "2020"]
+        process = start(work, args, FAKECDS_POLLS = "1000", FAKECDS_URL = server.url)
+        state_location = os.path.join(work, "data-2018-2020.nc.state")
+        deadline = time.time() + timeout
+        queued = []
+        planned = None
+        try:
+            while (len(queued) == 0 or len(queued) < planned):
+                expect(time.time() < deadline and process.poll() is None, "the requests were not all queued")
+                time.sleep(0.2)
+                if (os.path.exists(state_location)):
+                    with open(state_location) as f:
+                        checkpoints = list(json.load(f)["requests"].values())
+                    planned = len(checkpoints)
+                    queued = [checkpoint["request_id"] for checkpoint in checkpoints
+                              if checkpoint["request_id"] is not None]
+        finally:
+            stop(process)
+        lost = sorted(queued)[0]
+        os.remove(os.path.join(work, "fake", lost + ".json"))
+        first = len(calls(work, "retrieve"))
+        (status, output) = run(work, args, FAKECDS_POLLS = "1", FAKECDS_URL = server.url)
+        expect(status == 0, "rerun failed")
+        expect("Cannot continue request " + lost in output, "the unknown request was not reported")
+        expect(output.count("continues as request") == len(queued) - 1, "the other requests were not continued")
+        expect(len(calls(work, "retrieve")) == first + 1, "the rerun did not queue exactly one request")
+        expecthours(os.path.join(work, "data-2018-2020.nc"), "2018-01-01T00:00", "2020-12-31T23:00")
+    finally:
+        stopserver(server)
+
+checks = [
+    ("chunk-year",     checkchunkyear),
+    ("chunk-month",    checkchunkmonth),
+    ("chunk-failure",  checkchunkfailure),
+    ("async",          checkasync),
+    ("async-failure",  checkasyncfailure),
+    ("async-lost",     checkasynclost),
+    ("sites",          checksites),
+    ("resume-state",   checkresumestate),
+    ("range-resume",   checkrangeresume),
+    ("expired",        checkexpired),
+    ("reattach",       checkreattach)
+]
+
+def main():
+    global verbose
+    keep = ""
+    names = []
+    argv = sys.argv[1:]
+    i = 0
+    while (i < len(argv)):
+        opt = argv[i]
+        if (opt == "--keep"):
+            keep = argv[i+1]
+            i = i + 2
+        elif (opt == "--verbose"):
+            verbose = 1
+            i = i + 1
+        elif (opt.startswith("-")):
+            print("Unrecognised option " + opt)
+            sys.exit(1)
+        else:
+            names.append(opt)
+            i = i + 1
+    unknown = [name for name in names if name not in dict(checks)]
+    if (len(unknown) > 0):
+        print("Unknown checks " + " ".join(unknown))
+        sys.exit(1)
+    top = keep if keep != "" else tempfile.mkdtemp(prefix = "test-pull-")
+    failed = 0
+    try:
+        for (name, check) in checks:
+            if (len(names) > 0 and name not in names):
+                continue
+            work = os.path.join(top, name)
+            if (os.path.exists(work)):
+                shutil.rmtree(work)
+            os.makedirs(work)
+            try:
+                check(work)
+                print("%-22s ok" % name)
+            except CheckFailed as e:
+                failed = failed + 1
+                print("%-22s FAILED: %s" % (name, str(e)))
+    finally:
+        if (keep == ""):
+            shutil.rmtree(top)
+    if (failed > 0):
+        sys.exit(1)
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,48 @@
+#
+# Cave weather data as a library. With the src directory in the Python
+# path, many sites can be processed in one interpreter, e.g.:
+#
+#   import caveweather
+#   files = caveweather.pull([2019, 2020], latitude = 69.23, longitude = 21.42)
+#   hourly = caveweather.load(files)
+#   daily = caveweather.aggregate(hourly, "temperature", period = "month")
+#   caveweather.write(daily, "temperature.csv", format = "csv")
+#
+# The functions are looked up in their modules when first used, so
+# that e.g. the show-data.py command, which imports caveweather.showdata,
+# does not also import caveweather.pulldata and its dependencies.
+#
+
+import importlib
+
+exports = {
+    "pull"      : "caveweather.pulldata",
+    "pullsites" : "caveweather.pulldata",
+    "update"    : "caveweather.pulldata",
+    "load"      : "caveweather.showdata",
+    "aggregate" : "caveweather.showdata",
+    "write"     : "caveweather.showdata",
+    "convert"   : "caveweather.showdata",
+    "plot"      : "caveweather.showdata"
+}
+
+#
+# The error raised by the library functions when they fail, e.g., on
+# invalid arguments or failed pulls. The commands print its message
+# and exit with status 1.
+#
+
+class CaveWeatherError(Exception):
+    pass
+
+__all__ = list(exports) + ["CaveWeatherError"]
+
+def __getattr__(name):
+    if (name not in exports):
+        raise AttributeError("module 'caveweather' has no attribute '" + name + "'")
+    value = getattr(importlib.import_module(exports[name]), name)
+    globals()[name] = value
+    return(value)
+
+def __dir__():
+    return(sorted(list(globals()) + __all__))
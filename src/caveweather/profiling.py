@@ -0,0 +1,172 @@
+#
+# Profiling of pipeline stages, for the --profile options. When
+# enabled, each stage records its number of calls, wall time and CPU
+# time summed over the calls, the rows and bytes it processed, and the
+# peak resident set size of the process when it last ended. Pulls also
+# record the queueing and transfer time of each CDS request. The
+# summary is written as JSON. One of the stages can also be run under
+# cProfile, and its statistics dumped to a file.
+#
+
+import sys
+import time
+import json
+import threading
+import contextlib
+import cProfile
+try:
+    import resource
+except ImportError:
+    resource = None
+
+enabled = 0
+stages = {}
+requests = []
+started = (0.0, 0.0)
+lock = threading.Lock()
+profiledstage = ""
+profiler = None
+profileractive = 0
+profiled = 0
+
+#
+# Start profiling. Anything recorded earlier is forgotten, which also
+# clears the records that forked worker processes inherit.
+#
+
+def enable(stage = "", dumpfile = ""):
+    global enabled
+    global started
+    global profiledstage
+    global profiler
+    enabled = 1
+    started = (time.perf_counter(), time.process_time())
+    stages.clear()
+    del requests[:]
+    if (stage != "" and dumpfile != ""):
+        profiledstage = stage
+        profiler = (cProfile.Profile(), dumpfile)
+
+#
+# Peak resident set size in kilobytes, of this process and of its
+# finished child processes, or None if not known
+#
+
+def peakrss(who = "self"):
+    if (resource is None):
+        return(None)
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    if (sys.platform == "darwin"):
+        return(usage.ru_maxrss // 1024)
+    return(usage.ru_maxrss)
+
+#
+# Time a stage. The caller may add to the "rows" and "bytes" counts of
+# the dictionary given by the with statement.
+#
+
+@contextlib.contextmanager
+def stage(name):
+    global profileractive
+    global profiled
+    counts = {"rows": 0, "bytes": 0}
+    if (not enabled):
+        yield counts
+        return
+    profiling = 0
+    if (name == profiledstage):
+        with lock:
+            if (not profileractive):
+                profileractive = 1
+                profiled = 1
+                profiling = 1
+    if (profiling):
+        profiler[0].enable()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield counts
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        if (profiling):
+            profiler[0].disable()
+            with lock:
+                profileractive = 0
+        record(name, 1, wall, cpu, counts["rows"], counts["bytes"], peakrss())
+
+def record(name, calls, wall, cpu, rows, nbytes, rss):
+    with lock:
+        if (name not in stages):
+            stages[name] = {"name": name, "calls": 0, "wall": 0.0, "cpu": 0.0,
+                            "rows": 0, "bytes": 0, "peak_rss_kb": None}
+        entry = stages[name]
+        entry["calls"] = entry["calls"] + calls
+        entry["wall"] = entry["wall"] + wall
+        entry["cpu"] = entry["cpu"] + cpu
+        entry["rows"] = entry["rows"] + rows
+        entry["bytes"] = entry["bytes"] + nbytes
+        if (rss is not None):
+            entry["peak_rss_kb"] = max(entry["peak_rss_kb"] or 0, rss)
+
+#
+# Record a CDS request: the time it waited in the CDS queue, the time
+# its result took to download, and its size
+#
+
+def clock():
+    return(time.perf_counter())
+
+def request(name, queue, transfer, nbytes):
+    if (not enabled):
+        return
+    with lock:
+        requests.append({"name": name, "queue": queue, "transfer": transfer, "bytes": nbytes})
+
+#
+# Stages recorded in worker processes are collected there and merged
+# into the records of the main process
+#
+
+def collect():
+    with lock:
+        result = list(stages.values())
+        stages.clear()
+    return(result)
+
+def merge(records):
+    for entry in records:
+        record(entry["name"], entry["calls"], entry["wall"], entry["cpu"],
+               entry["rows"], entry["bytes"], entry["peak_rss_kb"])
+
+def summary(command):
+    return({
+        "command"              : command,
+        "wall"                 : time.perf_counter() - started[0],
+        "cpu"                  : time.process_time() - started[1],
+        "peak_rss_kb"          : peakrss(),
+        "children_peak_rss_kb" : peakrss("children"),
+        "stages"               : list(stages.values()),
+        "requests"             : requests
+    })
+
+#
+# Write the summary as JSON to the given file, or to the standard error
+# if no file is given, and the cProfile statistics if requested
+#
+
+def report(command, file_location = ""):
+    if (not enabled):
+        return
+    text = json.dumps(summary(command), indent = 2)
+    if (file_location == ""):
+        print(text, file = sys.stderr)
+    else:
+        with open(file_location, "w") as f:
+            f.write(text + "\n")
+    if (profiler is not None):
+        if (profiled):
+            profiler[0].dump_stats(profiler[1])
+        else:
+            print("Stage " + profiledstage + " was not run in this process, not writing " + profiler[1],
+                  file = sys.stderr)
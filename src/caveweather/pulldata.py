@@ -0,0 +1,1501 @@
+#
+# Pulling cave-relevant weather data from the CDS climate data service
+# into netCDF files. This is the library behind the pull-data.py
+# command; see that command for a description of the options, and
+# pull, pullsites, and update below for the functions to call.
+#
+
+import sys
+import os
+import time
+import json
+import shutil
+import hashlib
+import calendar as calendarmodule
+import csv
+import re
+from datetime import datetime, timezone
+import threading
+import concurrent.futures
+import netCDF4
+from netCDF4 import num2date
+import numpy as np
+from caveweather import profiling, CaveWeatherError
+
+def fatalerr(x):
+    raise CaveWeatherError(x)
+    
+def isoption(x):
+    if (len(x) > 0 and x[0] == '-'):
+        return(1)
+    else:
+        return(0)
+
+#
+# All days and hours of a month. Single digit days must have 0s in
+# front or that will cause an error. All hours are needed to get the
+# precipitation data right.
+#
+
+alldays = ['01','02','03','04','05','06','07','08','09','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31']
+allhours = ['00:00','01:00','02:00','03:00','04:00','05:00','06:00','07:00','08:00','09:00','10:00','11:00','12:00','13:00','14:00','15:00','16:00','17:00','18:00','19:00','20:00','21:00','22:00','23:00']
+
+#
+# The CDS client, created once and shared by all requests. Unless
+# 'waitforcompletion' is true, retrieve returns immediately after the
+# request has been queued (asynchronous mode). The cdsapi module is
+# imported only when a request is made, so that pulls served from the
+# cache do not import it.
+#
+
+cdsclients = {}
+
+def getclient(waitforcompletion = True):
+    if (waitforcompletion not in cdsclients):
+        import cdsapi
+        cdsclients[waitforcompletion] = cdsapi.Client(wait_until_complete = waitforcompletion)
+    return(cdsclients[waitforcompletion])
+
+dataset = 'reanalysis-era5-single-levels'
+variables = ['2m_temperature','convective_precipitation','runoff','sub_surface_runoff','surface_runoff','mean_runoff_rate','evaporation','snow_evaporation','snow_depth']
+
+def makerequest(year, month, day, area, time, variable = variables):
+    return({
+        'product_type':'reanalysis', # This is the dataset produced by the CDS
+        'variable': variable,
+        'year': year,
+        'month': month,
+        'day': day,
+        'area': area,
+        'time': time,
+        'format':'netcdf' # The format we choose to use
+    })
+
+#    Input:
+#        year, month, day, area, time: Strings
+#        variable: A list of variables
+#        checkpoint: The state of the request, see below
+#    Outputs:
+#        The name of the partial file the result was downloaded to
+#
+# The request is first waited for to complete at CDS, and its result
+# is then downloaded, so that the queueing and transfer times can be
+# profiled separately. If the result of the request is already known
+# from an earlier run, only its download is continued.
+
+def getdata(year, month, day, area, time, variable, checkpoint, name = ""):
+    with profiling.stage("request") as counts:
+        start = profiling.clock()
+        result = None
+        if (checkpoint["location"] is None):
+            result = getclient().retrieve(dataset,
+                                          makerequest(year, month, day, area, time, variable))
+            recordresult(checkpoint, result)
+        queued = profiling.clock()
+        downloadcheckpoint(checkpoint, result)
+        counts["bytes"] = os.path.getsize(checkpoint["file"])
+    profiling.request(name, queued - start, profiling.clock() - queued, counts["bytes"])
+    return(checkpoint["file"])
+
+def downloadresult(checkpoint, result, name, queue):
+    with profiling.stage("download") as counts:
+        start = profiling.clock()
+        downloadcheckpoint(checkpoint, result)
+        counts["bytes"] = os.path.getsize(checkpoint["file"])
+    profiling.request(name, queue, profiling.clock() - start, counts["bytes"])
+    return(checkpoint["file"])
+
+#
+# Split a pull of the given (year, month) pairs into chunks. Each
+# chunk is a tuple (years, months, name), where name identifies the
+# chunk in progress reports and in the names of the partial files.
+# Without chunking, years that need the same months are still pulled
+# in one request.
+#
+
+def planchunks(yearmonths, chunking):
+    byyear = {}
+    for (year, month) in yearmonths:
+        byyear.setdefault(year, []).append(month)
+    chunks = []
+    if (chunking == "month"):
+        for (year, month) in yearmonths:
+            chunks.append(([year], [month], year + "-" + month))
+    elif (chunking == "year"):
+        for year, yearmonthlist in byyear.items():
+            chunks.append(([year], yearmonthlist, year))
+    else:
+        bymonths = {}
+        for year, yearmonthlist in byyear.items():
+            bymonths.setdefault(tuple(yearmonthlist), []).append(year)
+        for monthlist, yearlist in bymonths.items():
+            name = yearlist[0] + "-" + yearlist[len(yearlist)-1]
+            if (len(bymonths) > 1):
+                name = name + "-" + monthlist[0] + "-" + monthlist[len(monthlist)-1] + "-" + str(len(chunks))
+            chunks.append((yearlist, list(monthlist), name))
+    return(chunks)
+
+#
+# Plan the CDS requests for the chunks. A request asks for every
+# combination of its years, months, days, hours and variables, so to
+# ask only for dates that exist, the months of a chunk are grouped by
+# their number of days (February separately in leap years), and each
+# group is requested with exactly its days. The number of fields in a
+# request is then exactly variables x days x hours. A request with
+# more fields than 'limit' is split by years, by months, or into
+# groups of variables, whichever gives the lowest total queue cost:
+# each request waits in the CDS queue for about 'requestcost' seconds,
+# and is then processed in about 'fieldcost' seconds per field. The
+# limit must allow at least one month of one variable, 'minfields'.
+#
+# Each request is a tuple (years, months, days, variables, name).
+# Requests that differ only in their variables are joined again after
+# they have been fetched (see joinrequests).
+#
+
+defaultmaxfields = 120000
+minfields = len(alldays) * len(allhours)
+requestcost = 60.0
+fieldcost = 0.001
+
+def requestfields(years, months, days, variablelist):
+    return(len(years) * len(months) * len(days) * len(allhours) * len(variablelist))
+
+def requestscost(requests):
+    return(sum([requestcost + fieldcost * requestfields(years, months, days, variablelist)
+                for (years, months, days, variablelist) in requests]))
+
+def daygroups(years, months):
+    bymonth = {}
+    for month in months:
+        for year in years:
+            days = calendarmodule.monthrange(int(year), int(month))[1]
+            bymonth.setdefault((days, month), []).append(year)
+    groups = {}
+    for (days, month), yearlist in bymonth.items():
+        groups.setdefault((days, tuple(yearlist)), []).append(month)
+    return([(list(yearlist), monthlist, alldays[:days]) for (days, yearlist), monthlist in groups.items()])
+
+def splitparts(items, size):
+    count = -(-len(items) // size)
+    size = -(-len(items) // count)
+    return([items[k:k+size] for k in range(0, len(items), size)])
+
+def splitrequest(years, months, days, variablelist, limit):
+    if (requestfields(years, months, days, variablelist) <= limit):
+        return([(years, months, days, variablelist)])
+    best = None
+    axes = [years, months, variablelist]
+    for axis in range(len(axes)):
+        if (len(axes[axis]) <= 1):
+            continue
+        unit = requestfields(years, months, days, variablelist) // len(axes[axis])
+        result = []
+        for part in splitparts(axes[axis], max(limit // unit, 1)):
+            split = list(axes)
+            split[axis] = part
+            result.extend(splitrequest(split[0], split[1], days, split[2], limit))
+        if (best is None or requestscost(result) < requestscost(best)):
+            best = result
+    if (best is None):
+        return([(years, months, days, variablelist)])
+    return(best)
+
+def planrequests(chunks, limit):
+    if (limit < minfields):
+        fatalerr("Maximum number of fields must be at least " + str(minfields))
+    requests = []
+    for (years, months, name) in chunks:
+        parts = []
+        for (groupyears, groupmonths, days) in daygroups(years, months):
+            parts.extend(splitrequest(groupyears, groupmonths, days, variables, limit))
+        for (k, (partyears, partmonths, days, variablelist)) in enumerate(parts):
+            partname = name if len(parts) == 1 else name + "-" + str(k + 1)
+            requests.append((partyears, partmonths, days, variablelist, partname))
+    return(requests)
+
+def listranges(items):
+    ranges = []
+    for item in items:
+        if (len(ranges) > 0 and int(item) == int(ranges[len(ranges)-1][1]) + 1):
+            ranges[len(ranges)-1][1] = item
+        else:
+            ranges.append([item, item])
+    return(",".join([first if first == last else first + "-" + last for (first, last) in ranges]))
+
+def printplan(requests, area):
+    total = sum([requestfields(years, months, days, variablelist)
+                 for (years, months, days, variablelist, name) in requests])
+    print("Area " + area + ": " + str(len(requests)) + " requests, " + str(total) + " fields, estimated queue cost " +
+          "%.0f s" % requestscost([request[:4] for request in requests]))
+    for (years, months, days, variablelist, name) in requests:
+        variablenames = "all variables" if variablelist == variables else ",".join(variablelist)
+        print("  Request " + name + ": years " + listranges(years) + ", months " + listranges(months) +
+              ", days 01-" + days[len(days)-1] + ", " + variablenames + ", " +
+              str(requestfields(years, months, days, variablelist)) + " fields")
+
+#
+# Checkpoints. The progress of a pull is kept in a state file, named as
+# the output file with ".state" appended. For each request, identified
+# by a hash of its contents, the state tells its partial file, the CDS
+# request ID once it has been queued, the location and size of its
+# result once it is complete, and whether the result has been
+# downloaded. A rerun of the same pull uses the results that were
+# downloaded, continues interrupted downloads with HTTP range
+# requests, continues waiting for requests that were queued, and only
+# makes the other requests again. Failed requests are retried up to
+# 'retries' times, after waiting 'retrydelay' seconds, twice as long
+# before each further retry. The state file is removed when the pull
+# is complete.
+#
+
+defaultretries = 4
+defaultretrydelay = 30.0 # seconds
+downloadtimeout = 60 # seconds
+statelock = threading.Lock()
+
+def loadstate(file_name):
+    state = {"file": file_name + ".state", "requests": {}}
+    if (os.path.exists(state["file"])):
+        try:
+            with open(state["file"]) as f:
+                state["requests"] = json.load(f)["requests"]
+            print("Continuing the pull recorded in " + state["file"])
+        except (OSError, ValueError, KeyError) as e:
+            print("Ignoring state file " + state["file"] + ": " + str(e))
+    for checkpoint in state["requests"].values():
+        checkpoint["state"] = state
+    return(state)
+
+#
+# Each checkpoint refers back to its state, for saving it, but that
+# reference is not saved
+#
+
+def savestate(state):
+    with statelock:
+        requests = {}
+        for key, checkpoint in state["requests"].items():
+            requests[key] = dict([(field, value) for (field, value) in checkpoint.items() if field != "state"])
+        with open(state["file"] + ".tmp", "w") as f:
+            json.dump({"requests": requests}, f, indent = 2)
+        os.replace(state["file"] + ".tmp", state["file"])
+
+def removestate(file_name):
+    if (not os.path.exists(file_name + ".state")):
+        return
+    with open(file_name + ".state") as f:
+        checkpoints = json.load(f)["requests"].values()
+    for checkpoint in checkpoints:
+        for partfile in [checkpoint["file"], checkpoint["file"] + ".download"]:
+            if (os.path.exists(partfile)):
+                os.remove(partfile)
+    os.remove(file_name + ".state")
+
+def requestkey(area, request):
+    (years, months, days, variablelist, name) = request
+    key = json.dumps({
+        'dataset': dataset,
+        'area': area,
+        'variables': variablelist,
+        'years': years,
+        'months': months,
+        'days': days
+    }, sort_keys = True)
+    return(hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+#
+# The checkpoint of a request, created if there is none. A new
+# checkpoint starts from scratch, removing any files left at its
+# partial file name by an earlier run that planned other requests.
+#
+
+def getcheckpoint(state, area, request, file_name):
+    key = requestkey(area, request)
+    with statelock:
+        if (key in state["requests"]):
+            return(state["requests"][key])
+        checkpoint = {
+            "name"       : request[4],
+            "file"       : file_name + "." + request[4] + ".part",
+            "request_id" : None,
+            "location"   : None,
+            "size"       : None,
+            "done"       : 0
+        }
+        state["requests"][key] = checkpoint
+        checkpoint["state"] = state
+    for partfile in [checkpoint["file"], checkpoint["file"] + ".download"]:
+        if (os.path.exists(partfile)):
+            os.remove(partfile)
+    return(checkpoint)
+
+def downloaded(checkpoint):
+    return(checkpoint["done"] and os.path.exists(checkpoint["file"]) and
+           os.path.getsize(checkpoint["file"]) == checkpoint["size"])
+
+#
+# Record the request ID of a queued request, and the location and size
+# of its result once it is complete. Clients whose results have no
+# location are downloaded through the client, and cannot be continued.
+#
+
+def recordresult(checkpoint, result):
+    reply = getattr(result, "reply", None) or {}
+    if (reply.get("request_id") is not None):
+        checkpoint["request_id"] = reply["request_id"]
+    if (reply.get("state", "completed") == "completed"):
+        try:
+            checkpoint["location"] = result.location
+            checkpoint["size"] = int(result.content_length)
+        except Exception:
+            checkpoint["location"] = None
+    savestate(checkpoint["state"])
+
+def forgetresult(checkpoint):
+    checkpoint["request_id"] = None
+    checkpoint["location"] = None
+    checkpoint["size"] = None
+    checkpoint["done"] = 0
+    if (os.path.exists(checkpoint["file"] + ".download")):
+        os.remove(checkpoint["file"] + ".download")
+    savestate(checkpoint["state"])
+
+#
+# Download a result into the partial file of its request. The data is
+# first written to a file with ".download" appended, and if one is
+# left from an interrupted download, only the rest of the data is
+# asked for with an HTTP range request. A result that has expired at
+# CDS (HTTP 404 or 410) is forgotten, so that it is requested again.
+#
+
+def httpdownload(url, size, file_location):
+    import requests
+    partial = file_location + ".download"
+    have = os.path.getsize(partial) if os.path.exists(partial) else 0
+    if (size is None or have < size):
+        headers = {}
+        if (have > 0):
+            print("Continuing the download of " + file_location + " from byte " + str(have))
+            headers["Range"] = "bytes=" + str(have) + "-"
+        with requests.get(url, headers = headers, stream = True, timeout = downloadtimeout) as response:
+            response.raise_for_status()
+            if (response.status_code != 206):
+                have = 0
+            with open(partial, "ab" if have > 0 else "wb") as f:
+                for block in response.iter_content(chunk_size = 64 * 1024):
+                    f.write(block)
+    have = os.path.getsize(partial)
+    if (size is not None and have != size):
+        raise IOError("Downloaded " + str(have) + " of " + str(size) + " bytes of " + file_location)
+    os.replace(partial, file_location)
+
+def downloadcheckpoint(checkpoint, result):
+    if (checkpoint["location"] is None):
+        result.download(checkpoint["file"])
+    else:
+        try:
+            httpdownload(checkpoint["location"], checkpoint["size"], checkpoint["file"])
+        except Exception as e:
+            if (getattr(getattr(e, "response", None), "status_code", None) in [404, 410]):
+                print("The result of chunk " + checkpoint["name"] + " has expired at CDS")
+                forgetresult(checkpoint)
+            raise
+    checkpoint["size"] = os.path.getsize(checkpoint["file"])
+    checkpoint["done"] = 1
+    savestate(checkpoint["state"])
+
+#
+# Continue waiting for a request queued by an earlier run. Returns
+# None if the request is not known to CDS anymore, or the client
+# cannot continue requests.
+#
+
+def reattach(checkpoint, client):
+    try:
+        import cdsapi.api
+        result = cdsapi.api.Result(client, {"request_id": checkpoint["request_id"], "state": "queued"})
+        result.update()
+        return(result)
+    except Exception as e:
+        print("Cannot continue request " + str(checkpoint["request_id"]) + ": " + str(e))
+        forgetresult(checkpoint)
+        return(None)
+
+#
+# Fetch the planned requests with at most 'jobs' requests in parallel.
+# The checkpoints are a dictionary from the names of the requests to
+# their checkpoints. Returns a dictionary from the names of the
+# requests that were successfully fetched to their partial files, and
+# the list of names of failed requests.
+#
+
+def getchunks(chunks, jobs, area, checkpoints):
+    partfiles = {}
+    failed = []
+    done = 0
+    getclient()
+    with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as pool:
+        futures = {}
+        for (years, months, days, variablelist, name) in chunks:
+            if (downloaded(checkpoints[name])):
+                print("Chunk " + name + " was downloaded earlier")
+                partfiles[name] = checkpoints[name]["file"]
+                continue
+            if (checkpoints[name]["location"] is None):
+                print("Chunk " + name + " submitted")
+            else:
+                print("Chunk " + name + " continues downloading")
+            future = pool.submit(getdata,
+                                 year = years,
+                                 month = months,
+                                 day = days,
+                                 area = area,
+                                 time = allhours,
+                                 variable = variablelist,
+                                 checkpoint = checkpoints[name],
+                                 name = name)
+            futures[future] = name
+        done = len(partfiles)
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            done = done + 1
+            try:
+                partfiles[name] = future.result()
+                print("Chunk " + name + " done (" + str(done) + "/" + str(len(chunks)) + ")")
+            except Exception as e:
+                failed.append(name)
+                print("Chunk " + name + " failed (" + str(done) + "/" + str(len(chunks)) + "): " + str(e))
+    return(partfiles, failed)
+
+#
+# Fetch all chunks asynchronously: queue every request at once, then
+# poll them all from one loop, and download each result (with at most
+# 'jobs' downloads in parallel) as soon as it is complete. Requests
+# queued by an earlier run are polled instead of queued again. A
+# request that cannot be polled 'maxpollfailures' times in a row (for
+# example, because it has expired or been deleted at CDS) is forgotten
+# and fails, so that it is queued again on retry. Returns the same as
+# getchunks.
+#
+
+maxpollfailures = 5
+
+def getchunksasync(chunks, jobs, area, checkpoints):
+    partfiles = {}
+    failed = []
+    pending = {}
+    client = getclient(False)
+    for (years, months, days, variablelist, name) in chunks:
+        checkpoint = checkpoints[name]
+        if (downloaded(checkpoint)):
+            print("Chunk " + name + " was downloaded earlier")
+            partfiles[name] = checkpoint["file"]
+            continue
+        if (checkpoint["location"] is not None):
+            pending[name] = None
+            continue
+        if (checkpoint["request_id"] is not None):
+            result = reattach(checkpoint, client)
+            if (result is not None):
+                pending[name] = result
+                print("Chunk " + name + " continues as request " + str(checkpoint["request_id"]))
+                continue
+        try:
+            result = client.retrieve(dataset,
+                                     makerequest(years, months, days, area, allhours, variablelist))
+            recordresult(checkpoint, result)
+            pending[name] = result
+            print("Chunk " + name + " queued as request " + str(result.reply.get('request_id')))
+        except Exception as e:
+            failed.append(name)
+            print("Chunk " + name + " failed to queue: " + str(e))
+    states = {}
+    queued = {}
+    pollfailures = {}
+    for name in pending:
+        queued[name] = profiling.clock()
+    sleep = 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as pool:
+        downloads = {}
+        while (len(pending) > 0):
+            for name in list(pending.keys()):
+                result = pending[name]
+                if (result is None):
+                    state = "completed"
+                else:
+                    try:
+                        result.update()
+                    except Exception as e:
+                        print("Chunk " + name + " could not be polled: " + str(e))
+                        pollfailures[name] = pollfailures.get(name, 0) + 1
+                        if (pollfailures[name] >= maxpollfailures):
+                            forgetresult(checkpoints[name])
+                            failed.append(name)
+                            del pending[name]
+                        continue
+                    pollfailures[name] = 0
+                    state = result.reply['state']
+                if (states.get(name) != state):
+                    print("Chunk " + name + " is " + state)
+                    states[name] = state
+                if (state == "completed"):
+                    if (result is not None):
+                        recordresult(checkpoints[name], result)
+                    downloads[pool.submit(downloadresult, checkpoints[name], result, name,
+                                          profiling.clock() - queued[name])] = name
+                    del pending[name]
+                elif (state not in ["queued", "running", "accepted"]):
+                    forgetresult(checkpoints[name])
+                    failed.append(name)
+                    del pending[name]
+            if (len(pending) > 0):
+                time.sleep(sleep)
+                sleep = min(sleep * 1.5, 30)
+        for future in concurrent.futures.as_completed(downloads):
+            name = downloads[future]
+            try:
+                partfiles[name] = future.result()
+                print("Chunk " + name + " downloaded (" + str(len(partfiles)) + "/" + str(len(chunks)) + ")")
+            except Exception as e:
+                failed.append(name)
+                print("Chunk " + name + " download failed: " + str(e))
+    return(partfiles, failed)
+
+#
+# Fetch the chunks, continuing from the checkpoints of earlier runs,
+# and retrying the failed chunks with exponential backoff. Returns the
+# same as getchunks.
+#
+
+def fetchchunks(chunks, jobs, area, file_name, asyncmode, retries, retrydelay):
+    state = loadstate(file_name)
+    checkpoints = dict([(chunk[4], getcheckpoint(state, area, chunk, file_name)) for chunk in chunks])
+    savestate(state)
+    partfiles = {}
+    pending = chunks
+    delay = retrydelay
+    for attempt in range(retries + 1):
+        if (attempt > 0):
+            print("Retrying " + str(len(pending)) + " failed chunks in " + "%.0f" % delay + " s")
+            time.sleep(delay)
+            delay = delay * 2
+        if (asyncmode):
+            (fetched, failed) = getchunksasync(pending, jobs, area, checkpoints)
+        else:
+            (fetched, failed) = getchunks(pending, jobs, area, checkpoints)
+        partfiles.update(fetched)
+        pending = [chunk for chunk in pending if chunk[4] in failed]
+        if (len(pending) == 0):
+            break
+    return(partfiles, [chunk[4] for chunk in pending])
+
+#
+# Join the partial files of requests that differ only in their
+# variables into one file, by adding the variables of the others to
+# the first one. The packed values are copied as they are. Returns
+# the joined files, one for each set of years and months, in request
+# order. The files of a set of which some request failed are left for
+# a rerun to continue from.
+#
+
+def joinvariables(partfiles):
+    out = netCDF4.Dataset(partfiles[0], "a")
+    for partfile in partfiles[1:]:
+        part = netCDF4.Dataset(partfile)
+        for name, var in part.variables.items():
+            if (name in out.variables):
+                continue
+            attrs = var.__dict__.copy()
+            fill = attrs.pop('_FillValue', None)
+            outvar = out.createVariable(name, var.dtype, var.dimensions, fill_value = fill)
+            outvar.setncatts(attrs)
+            var.set_auto_maskandscale(False)
+            outvar.set_auto_maskandscale(False)
+            outvar[:] = var[:]
+        part.close()
+        os.remove(partfile)
+    out.close()
+    return(partfiles[0])
+
+def joinrequests(requests, partfiles):
+    groups = {}
+    for (years, months, days, variablelist, name) in requests:
+        groups.setdefault((tuple(years), tuple(months)), []).append(name)
+    result = []
+    for names in groups.values():
+        if (all([name in partfiles for name in names])):
+            result.append(joinvariables([partfiles[name] for name in names]))
+    return(result)
+
+#
+# Write the given time slices of netCDF datasets, in order, into one
+# file along the time dimension. The pieces are tuples (dataset, start,
+# stop). The optional 'select' maps other dimensions (such as latitude
+# and longitude) to a single index to keep. The input files may be
+# packed with different scale factors, so the written data variables
+# are stored unpacked as float32.
+#
+
+def writepieces(pieces, file_location, select = {}):
+    first = pieces[0][0]
+    timeunits = first.variables['time'].units
+    calendar = getattr(first.variables['time'], 'calendar', 'standard')
+    total = sum([stop - start for (part, start, stop) in pieces])
+    def dimsize(dim):
+        if (dim in select):
+            return(1)
+        return(len(first.dimensions[dim]))
+    def sliceof(var, start, stop):
+        index = []
+        for dim in var.dimensions:
+            if (dim == 'time'):
+                index.append(slice(start, stop))
+            elif (dim in select):
+                index.append(slice(select[dim], select[dim]+1))
+            else:
+                index.append(slice(None))
+        return(tuple(index))
+    out = netCDF4.Dataset(file_location, "w")
+    out.setncatts(first.__dict__)
+    for name, dim in first.dimensions.items():
+        if (name == 'time'):
+            out.createDimension(name, None)
+        else:
+            out.createDimension(name, dimsize(name))
+    for name, var in first.variables.items():
+        attrs = var.__dict__.copy()
+        if ('time' in var.dimensions and name != 'time'):
+            for attr in ['scale_factor', 'add_offset', '_FillValue', 'missing_value']:
+                attrs.pop(attr, None)
+            chunksizes = [min(max(total, 1), 8784) if dim == 'time' else dimsize(dim)
+                          for dim in var.dimensions]
+            outvar = out.createVariable(name, 'f4', var.dimensions, fill_value = np.float32(-32767),
+                                        zlib = True, chunksizes = chunksizes)
+            outvar.missing_value = np.float32(-32767)
+        else:
+            attrs.pop('_FillValue', None)
+            outvar = out.createVariable(name, var.dtype, var.dimensions)
+        outvar.setncatts(attrs)
+        if ('time' not in var.dimensions):
+            outvar[:] = var[sliceof(var, None, None)]
+    offset = 0
+    for (part, start, stop) in pieces:
+        n = stop - start
+        timevar = part.variables['time']
+        out.variables['time'][offset:offset+n] = netCDF4.date2num(
+            num2date(timevar[start:stop], timevar.units, calendar), timeunits, calendar)
+        for name, var in part.variables.items():
+            if ('time' in var.dimensions and name != 'time'):
+                outindex = [slice(None)] * len(var.dimensions)
+                outindex[var.dimensions.index('time')] = slice(offset, offset+n)
+                out.variables[name][tuple(outindex)] = var[sliceof(var, start, stop)]
+        offset = offset + n
+    out.close()
+    return(file_location)
+
+#
+# The runs of consecutive time steps in the same month in a dataset, as
+# tuples (year, month, start, stop)
+#
+
+def monthruns(part):
+    timevar = part.variables['time']
+    dates = num2date(timevar[:], timevar.units, getattr(timevar, 'calendar', 'standard'))
+    runs = []
+    start = 0
+    while (start < len(dates)):
+        stop = start
+        while (stop < len(dates) and dates[stop].year == dates[start].year and dates[stop].month == dates[start].month):
+            stop = stop + 1
+        runs.append((dates[start].year, dates[start].month, start, stop))
+        start = stop
+    return(runs)
+
+#
+# Merge partial files into one file along the time dimension, in time
+# order. The months in different files may interleave, as when months
+# of different lengths were requested separately. The partial files
+# are removed afterwards, unless 'remove' is false.
+#
+
+def mergechunks(partfiles, file_location, remove = True):
+    if (len(partfiles) == 1):
+        if (remove):
+            os.replace(partfiles[0], file_location)
+        else:
+            shutil.copyfile(partfiles[0], file_location)
+        return(file_location)
+    parts = [netCDF4.Dataset(partfile) for partfile in partfiles]
+    timeunits = parts[0].variables['time'].units
+    calendar = getattr(parts[0].variables['time'], 'calendar', 'standard')
+    def firsttime(piece):
+        (part, start, stop) = piece
+        timevar = part.variables['time']
+        return(netCDF4.date2num(num2date(timevar[start], timevar.units, calendar),
+                                timeunits, calendar))
+    pieces = []
+    for part in parts:
+        for (year, month, start, stop) in monthruns(part):
+            pieces.append((part, start, stop))
+    pieces.sort(key = firsttime)
+    writepieces(pieces, file_location)
+    for part in parts:
+        part.close()
+    if (remove):
+        for partfile in partfiles:
+            os.remove(partfile)
+    return(file_location)
+
+#
+# Return the last time in a file, as a datetime
+#
+
+def lasttime(file_location):
+    f = netCDF4.Dataset(file_location)
+    timevar = f.variables['time']
+    result = num2date(timevar[len(timevar)-1], timevar.units,
+                      getattr(timevar, 'calendar', 'standard'),
+                      only_use_cftime_datetimes = False)
+    f.close()
+    return(result)
+
+#
+# Return the (year, month) pairs after time 'last', up to and
+# including the month of time 'now'. The month of 'last' itself is
+# included if 'last' is not its final hour.
+#
+
+def monthsafter(last, now):
+    year = last.year
+    month = last.month
+    if (last.day == calendarmodule.monthrange(year, month)[1] and last.hour == 23):
+        month = month + 1
+        if (month > 12):
+            month = 1
+            year = year + 1
+    result = []
+    while ((year, month) <= (now.year, now.month)):
+        result.append(("%04d" % year, "%02d" % month))
+        month = month + 1
+        if (month > 12):
+            month = 1
+            year = year + 1
+    return(result)
+
+#
+# Append the data in file 'newfile' that is later than time 'last' to
+# the end of an existing file. The existing data is not rewritten,
+# unless the new values of a variable do not fit the int16 packing of
+# the file (as in files straight from CDS): the file is then first
+# rewritten with its values unpacked as float32. Returns the number of
+# time steps appended.
+#
+
+def fitspacking(outvar, data):
+    if (not hasattr(outvar, 'scale_factor') or not np.issubdtype(outvar.dtype, np.integer)):
+        return(1)
+    if (np.ma.count(data) == 0):
+        return(1)
+    packed = (data - getattr(outvar, 'add_offset', 0.0)) / outvar.scale_factor
+    return(np.ma.max(np.abs(packed)) < np.iinfo(outvar.dtype).max)
+
+def unpackfile(file_location):
+    temporary = file_location + "." + str(os.getpid()) + ".tmp"
+    old = netCDF4.Dataset(file_location)
+    writepieces([(old, 0, len(old.variables['time']))], temporary)
+    old.close()
+    os.replace(temporary, file_location)
+
+def appendafter(newfile, file_location, last):
+    new = netCDF4.Dataset(newfile)
+    out = netCDF4.Dataset(file_location)
+    newtime = new.variables['time']
+    outtime = out.variables['time']
+    calendar = getattr(outtime, 'calendar', 'standard')
+    times = netCDF4.date2num(num2date(newtime[:], newtime.units, calendar),
+                             outtime.units, calendar)
+    start = int(np.searchsorted(times, netCDF4.date2num(last, outtime.units, calendar), side = 'right'))
+    n = len(times) - start
+    if (n <= 0):
+        new.close()
+        out.close()
+        return(0)
+    def timeindex(var, start, stop):
+        index = [slice(None)] * len(var.dimensions)
+        index[var.dimensions.index('time')] = slice(start, stop)
+        return(tuple(index))
+    appended = [name for name, var in new.variables.items()
+                if ('time' in var.dimensions and name != 'time' and name in out.variables)]
+    overflow = []
+    for name in appended:
+        var = new.variables[name]
+        if (not fitspacking(out.variables[name], var[timeindex(var, start, start+n)])):
+            overflow.append(name)
+    out.close()
+    if (len(overflow) > 0):
+        print("New values of " + ", ".join(overflow) + " do not fit the packing of " + file_location +
+              "; rewriting it with values unpacked as float32")
+        unpackfile(file_location)
+    out = netCDF4.Dataset(file_location, "a")
+    outtime = out.variables['time']
+    offset = len(outtime)
+    outtime[offset:offset+n] = times[start:]
+    for name in appended:
+        var = new.variables[name]
+        out.variables[name][timeindex(var, offset, offset+n)] = var[timeindex(var, start, start+n)]
+    new.close()
+    out.close()
+    return(n)
+
+#
+# The local cache of pulled data. Data is cached per month, in files
+# named by a hash of the area, variables, year and month. Only
+# complete months are used from the cache. The least recently used
+# files are evicted when the cache grows over its size limit.
+#
+
+defaultcachedir = os.path.join(os.path.expanduser("~"), ".cache", "cave-weather-data")
+defaultcachesize = 1024 # megabytes
+
+def cachekey(area, year, month):
+    key = json.dumps({
+        'dataset': dataset,
+        'area': "/".join(["%.6f" % float(x) for x in area.split("/")]),
+        'variables': sorted(variables),
+        'year': year,
+        'month': month
+    }, sort_keys = True)
+    return(hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+def cachelookup(cachedir, area, year, month):
+    path = os.path.join(cachedir, cachekey(area, year, month) + ".nc")
+    if (not os.path.exists(path)):
+        return(None)
+    os.utime(path)
+    return(path)
+
+#
+# Split a fetched file into months and store them in the cache.
+# Returns a dictionary from (year, month) to the cached file. Months
+# that are not complete are stored in temporary files that are not
+# found by later lookups, and that the caller should remove. Each
+# month is written to a file of this process and then renamed, so
+# that pulls running at the same time never write the same file.
+#
+
+def cachestore(cachedir, partfile, area):
+    result = {}
+    os.makedirs(cachedir, exist_ok = True)
+    part = netCDF4.Dataset(partfile)
+    for (year, month, start, stop) in monthruns(part):
+        key = cachekey(area, "%04d" % year, "%02d" % month)
+        if (stop - start == calendarmodule.monthrange(year, month)[1] * 24):
+            path = os.path.join(cachedir, key + ".nc")
+        else:
+            path = os.path.join(cachedir, key + "." + str(os.getpid()) + ".incomplete")
+        temporary = os.path.join(cachedir, key + "." + str(os.getpid()) + ".tmp")
+        writepieces([(part, start, stop)], temporary)
+        os.replace(temporary, path)
+        result[("%04d" % year, "%02d" % month)] = path
+    part.close()
+    return(result)
+
+def removeincomplete(cached):
+    for path in cached.values():
+        if (path.endswith(".incomplete")):
+            os.remove(path)
+
+def cacheevict(cachedir, cachesize):
+    if (not os.path.isdir(cachedir)):
+        return
+    files = []
+    total = 0
+    for name in os.listdir(cachedir):
+        if (name.endswith(".nc")):
+            path = os.path.join(cachedir, name)
+            info = os.stat(path)
+            files.append((info.st_mtime, info.st_size, path))
+            total = total + info.st_size
+    files.sort()
+    for (mtime, size, path) in files:
+        if (total <= cachesize * 1024 * 1024):
+            break
+        print("Evicting " + path + " from cache")
+        os.remove(path)
+        total = total - size
+
+#
+# Plan the pull of the given (year, month) pairs for an area
+# (north/west/south/east): find the months in the cache unless
+# 'usecache' is false, and plan the requests for the rest. Returns a
+# dictionary from the cached (year, month) pairs to their files, and
+# the list of requests.
+#
+
+def planarea(yearmonths, area, chunking, usecache, refresh, cachedir, maxfields):
+    cached = {}
+    if (usecache and not refresh):
+        with profiling.stage("cache-lookup") as counts:
+            for (year, month) in yearmonths:
+                path = cachelookup(cachedir, area, year, month)
+                if (path is not None):
+                    cached[(year, month)] = path
+            counts["rows"] = len(yearmonths)
+    missing = [yearmonth for yearmonth in yearmonths if yearmonth not in cached]
+    if (usecache):
+        print("Months in cache = " + str(len(cached)) + ", to pull = " + str(len(missing)))
+    return(cached, planrequests(planchunks(missing, chunking), maxfields))
+
+def showplan(yearmonths, area, chunking, usecache, refresh, cachedir, maxfields):
+    (cached, requests) = planarea(yearmonths, area, chunking, usecache, refresh, cachedir, maxfields)
+    printplan(requests, area)
+    return(requests)
+
+#
+# Pull the given (year, month) pairs for an area into one file. Returns
+# 1 on success. If some chunks could not be pulled, the chunks that
+# were are kept (in the cache, or as partial files) for a rerun to
+# continue from, and the pull ends in a fatal error.
+#
+
+def pullarea(yearmonths, area, file_name, chunking, jobs, asyncmode, usecache, refresh,
+             cachedir, cachesize, maxfields, retries, retrydelay):
+    (cached, chunks) = planarea(yearmonths, area, chunking, usecache, refresh, cachedir, maxfields)
+    print("Chunks = " + str(len(chunks)) + ", jobs = " + str(jobs))
+    if (len(chunks) == 0):
+        (partfiles, failed) = ({}, [])
+    else:
+        (partfiles, failed) = fetchchunks(chunks, jobs, area, file_name, asyncmode, retries, retrydelay)
+    if (len(failed) > 0 and not usecache):
+        fatalerr("Failed chunks: " + " ".join(failed) + "; run again to continue")
+    partfiles = joinrequests(chunks, partfiles)
+    if (usecache):
+        for partfile in partfiles:
+            with profiling.stage("cache-store") as counts:
+                counts["bytes"] = os.path.getsize(partfile)
+                cached.update(cachestore(cachedir, partfile, area))
+                os.remove(partfile)
+    if (len(failed) > 0):
+        removeincomplete(cached)
+        fatalerr("Failed chunks: " + " ".join(failed) + "; run again to continue")
+    with profiling.stage("merge") as counts:
+        if (usecache):
+            mergechunks([cached[yearmonth] for yearmonth in yearmonths], file_name, remove = False)
+            removeincomplete(cached)
+        else:
+            mergechunks(partfiles, file_name)
+        counts["bytes"] = os.path.getsize(file_name)
+    removestate(file_name)
+    if (usecache):
+        with profiling.stage("cache-evict"):
+            cacheevict(cachedir, cachesize)
+    return(1)
+
+#
+# Read a list of sites from a CSV file with lines 'name,latitude,longitude'.
+# Empty lines, lines starting with '#', and a header line are skipped.
+# The names are made safe for file names, and must stay distinct.
+# Returns a list of tuples (name, latitude, longitude).
+#
+
+def readsites(file_location):
+    sites = []
+    names = {}
+    with open(file_location, newline = '') as f:
+        for row in csv.reader(f):
+            if (len(row) == 0 or row[0].strip() == "" or row[0].strip()[0] == '#'):
+                continue
+            if (len(row) < 3):
+                fatalerr("Expected name, latitude, and longitude in " + file_location + ": " + ",".join(row))
+                continue
+            try:
+                latitude = float(row[1])
+                longitude = float(row[2])
+            except ValueError:
+                if (len(sites) == 0):
+                    continue
+                fatalerr("Invalid coordinates in " + file_location + ": " + ",".join(row))
+                continue
+            name = re.sub(r"[^A-Za-z0-9_.-]+", "_", row[0].strip())
+            if (name in names):
+                fatalerr("Sites " + names[name] + " and " + row[0].strip() + " in " + file_location +
+                         " would both be written to files named " + name)
+                continue
+            names[name] = row[0].strip()
+            sites.append((name, latitude, longitude))
+    return(sites)
+
+#
+# Group sites into clusters whose bounding box spans at most 'span'
+# degrees in both latitude and longitude. Returns a list of clusters,
+# each a list of indexes to the sites.
+#
+
+def clustersites(sites, span):
+    clusters = []
+    boxes = []
+    order = sorted(range(len(sites)), key = lambda i: (sites[i][1], sites[i][2]))
+    for i in order:
+        (name, latitude, longitude) = sites[i]
+        for k, (south, west, north, east) in enumerate(boxes):
+            newbox = (min(south, latitude), min(west, longitude),
+                      max(north, latitude), max(east, longitude))
+            if (newbox[2] - newbox[0] <= span and newbox[3] - newbox[1] <= span):
+                boxes[k] = newbox
+                clusters[k].append(i)
+                break
+        else:
+            boxes.append((latitude, longitude, latitude, longitude))
+            clusters.append([i])
+    return(clusters)
+
+#
+# The area to pull for a cluster. The bounding box of the sites is
+# padded by half a grid step on all sides, so that it includes the
+# nearest grid cell of each site (e.g., for a site at 69.63 the cell
+# at 69.75).
+#
+
+gridstep = 0.25 # degrees
+
+def clusterarea(sites, cluster):
+    latitudes = [sites[i][1] for i in cluster]
+    longitudes = [sites[i][2] for i in cluster]
+    pad = gridstep / 2
+    north = min(max(latitudes) + pad, 90.0)
+    south = max(min(latitudes) - pad, -90.0)
+    return("/".join([str(round(x, 6)) for x in [north, min(longitudes) - pad, south, max(longitudes) + pad]]))
+
+#
+# Index of the nearest grid point for each of the given values. The
+# grid may be in either ascending or descending order.
+#
+
+def nearestindex(grid, values):
+    order = np.argsort(grid)
+    sortedgrid = grid[order]
+    pos = np.clip(np.searchsorted(sortedgrid, values), 1, max(len(sortedgrid) - 1, 1))
+    below = np.abs(values - sortedgrid[pos - 1])
+    above = np.abs(values - sortedgrid[np.minimum(pos, len(sortedgrid) - 1)])
+    pos = np.where(below <= above, pos - 1, np.minimum(pos, len(sortedgrid) - 1))
+    return(order[pos])
+
+#
+# Extract the nearest grid cell for each site from an area file, into
+# a file per site
+#
+
+def extractsites(file_location, sites, site_names):
+    f = netCDF4.Dataset(file_location)
+    latindex = nearestindex(np.asarray(f.variables['latitude'][:]),
+                            np.array([site[1] for site in sites]))
+    lonindex = nearestindex(np.asarray(f.variables['longitude'][:]),
+                            np.array([site[2] for site in sites]))
+    n = len(f.dimensions['time'])
+    for k in range(len(sites)):
+        writepieces([(f, 0, n)], site_names[k],
+                    select = {'latitude': int(latindex[k]), 'longitude': int(lonindex[k])})
+    f.close()
+
+#
+# Library interface. These functions pull data as the pull-data.py
+# command does, and return the names of the files written. Years and
+# months are given as numbers or as strings. Failures raise
+# CaveWeatherError. In a dry run, nothing is pulled or written, and the
+# planned CDS requests are printed and returned instead. The cache
+# directory and size, the largest request, and the retries of failed
+# requests are keyword arguments, with the defaults of the command.
+#
+
+defaultlatitude  = "69.232023" # Njiellalanjävri
+defaultlongitude = "21.420556"
+allmonths = ["01","02","03","04","05","06","07","08","09","10","11","12"]
+
+def yearmonthsof(years, months):
+    return([("%04d" % int(year), "%02d" % int(month)) for year in years for month in months])
+
+def datafilename(years, months):
+    months = ["%02d" % int(month) for month in months]
+    if (len(months) == 12):
+        monthpart = ""
+    elif (len(months) == 1):
+        monthpart = "-" + months[0]
+    else:
+        monthpart = "-" + months[0] + "-" + months[len(months)-1]
+    return('data-' + str(years[0]) + "-" + str(years[len(years)-1]) + monthpart + ".nc")
+
+def pointarea(latitude, longitude):
+    # The ERA5 accept rectangular shape grid as a searching areas
+    # but we can use also input a point with this system:
+    latitude = str(float(latitude))
+    longitude = str(float(longitude))
+    return(latitude +'/'+ longitude +'/'+ latitude +'/'+ longitude)
+
+def setupchunking(chunking, jobs, asyncmode):
+    if (chunking == ""):
+        if (jobs > 1 or asyncmode):
+            return("year")
+        return("none")
+    return(chunking)
+
+def pull(years, months = allmonths, latitude = defaultlatitude, longitude = defaultlongitude,
+         file_name = None, jobs = 1, chunking = "", asyncmode = 0, usecache = 1, refresh = 0,
+         dryrun = 0, cachedir = defaultcachedir, cachesize = defaultcachesize,
+         maxfields = defaultmaxfields, retries = defaultretries, retrydelay = defaultretrydelay):
+    if (file_name is None):
+        file_name = datafilename(years, months)
+    chunking = setupchunking(chunking, jobs, asyncmode)
+    if (dryrun):
+        return(showplan(yearmonthsof(years, months), pointarea(latitude, longitude),
+                        chunking, usecache, refresh, cachedir, maxfields))
+    if (not pullarea(yearmonthsof(years, months), pointarea(latitude, longitude), file_name,
+                     chunking, jobs, asyncmode, usecache, refresh,
+                     cachedir, cachesize, maxfields, retries, retrydelay)):
+        return(None)
+    return(file_name)
+
+#
+# Pull data for sites given as tuples (name, latitude, longitude), with
+# nearby sites pulled together (see clustersites). Returns the list of
+# files written, one per site.
+#
+
+def pullsites(sites, years, months = allmonths, file_name = None, span = 2.0,
+              jobs = 1, chunking = "", asyncmode = 0, usecache = 1, refresh = 0, dryrun = 0,
+              cachedir = defaultcachedir, cachesize = defaultcachesize, maxfields = defaultmaxfields,
+              retries = defaultretries, retrydelay = defaultretrydelay):
+    if (file_name is None):
+        file_name = datafilename(years, months)
+    chunking = setupchunking(chunking, jobs, asyncmode)
+    yearmonths = yearmonthsof(years, months)
+    clusters = clustersites(sites, span)
+    print("Sites = " + str(len(sites)) + ", areas to pull = " + str(len(clusters)))
+    result = []
+    for (k, cluster) in enumerate(clusters):
+        area = clusterarea(sites, cluster)
+        box_name = file_name[:-3] + ".area" + str(k) + ".nc"
+        print("Area " + str(k) + " = " + area + ", sites = " + str(len(cluster)))
+        if (dryrun):
+            result.extend(showplan(yearmonths, area, chunking, usecache, refresh, cachedir, maxfields))
+            continue
+        if (not pullarea(yearmonths, area, box_name, chunking, jobs, asyncmode, usecache, refresh,
+                         cachedir, cachesize, maxfields, retries, retrydelay)):
+            return(None)
+        site_names = ['data-' + sites[i][0] + file_name[4:] for i in cluster]
+        with profiling.stage("extract") as counts:
+            extractsites(box_name, [sites[i] for i in cluster], site_names)
+            counts["rows"] = len(site_names)
+        os.remove(box_name)
+        for site_name in site_names:
+            print("Wrote " + site_name)
+        result.extend(site_names)
+    return(result)
+
+#
+# Extend an existing file with any newer data, up to the current time.
+# Unless given, the coordinates are taken from the file. Returns the
+# number of hours appended.
+#
+
+def update(file_location, latitude = None, longitude = None,
+           jobs = 1, chunking = "", asyncmode = 0, usecache = 1, refresh = 0, dryrun = 0,
+           cachedir = defaultcachedir, cachesize = defaultcachesize, maxfields = defaultmaxfields,
+           retries = defaultretries, retrydelay = defaultretrydelay):
+    f = netCDF4.Dataset(file_location)
+    unlimited = f.dimensions['time'].isunlimited()
+    if (latitude is None or longitude is None):
+        latitude = str(float(f.variables['latitude'][0]))
+        longitude = str(float(f.variables['longitude'][0]))
+    f.close()
+    if (not unlimited):
+        fatalerr("Cannot append to " + file_location + ", its time dimension is not unlimited")
+        return(None)
+    last = lasttime(file_location)
+    yearmonths = monthsafter(last, datetime.now(timezone.utc))
+    print("Updating " + file_location + " after " + str(last) + " now...")
+    if (len(yearmonths) == 0):
+        print("Nothing to update")
+        return(0)
+    print("Months = " + str(yearmonths))
+    file_name = file_location + ".update.nc"
+    chunking = setupchunking(chunking, jobs, asyncmode)
+    if (dryrun):
+        return(showplan(yearmonths, pointarea(latitude, longitude), chunking, usecache, refresh,
+                        cachedir, maxfields))
+    if (not pullarea(yearmonths, pointarea(latitude, longitude), file_name,
+                     chunking, jobs, asyncmode, usecache, refresh,
+                     cachedir, cachesize, maxfields, retries, retrydelay)):
+        return(None)
+    with profiling.stage("append") as counts:
+        n = appendafter(file_name, file_location, last)
+        counts["rows"] = n
+    os.remove(file_name)
+    print("Appended " + str(n) + " hours to " + file_location)
+    return(n)
+
+#
+# The command. Fatal errors are printed, and exit with status 1.
+#
+
+def main(argv = None):
+    try:
+        command(argv)
+    except CaveWeatherError as e:
+        print("Fatal error: " + str(e) + " -- exit")
+        sys.exit(1)
+
+def command(argv = None):
+    if (argv is None):
+        argv = sys.argv
+    latitude  = defaultlatitude
+    longitude = defaultlongitude
+    ystart = 2019 # latest year in the database
+    yend = ystart
+    months = allmonths
+    jobs = 1
+    chunking = ""
+    asyncmode = 0
+    usecache = 1
+    refresh = 0
+    updatefile = ""
+    coordinatesgiven = 0
+    sitesfile = ""
+    clusterspan = 2.0
+    profile = 0
+    profilefile = ""
+    dumpstage = ""
+    dumpfile = ""
+    dryrun = 0
+    cachedir = defaultcachedir
+    cachesize = defaultcachesize
+    maxfields = defaultmaxfields
+    retries = defaultretries
+    retrydelay = defaultretrydelay
+    #
+    # Inner function 'processoption'
+    #
+    def processoption(opt,i,argv):
+        nonlocal months
+        nonlocal latitude; 
+        nonlocal longitude;
+        nonlocal jobs
+        nonlocal chunking
+        nonlocal asyncmode
+        nonlocal usecache
+        nonlocal refresh
+        nonlocal updatefile
+        nonlocal coordinatesgiven
+        nonlocal sitesfile
+        nonlocal clusterspan
+        nonlocal profile
+        nonlocal profilefile
+        nonlocal dumpstage
+        nonlocal dumpfile
+        nonlocal dryrun
+        nonlocal cachedir
+        nonlocal cachesize
+        nonlocal maxfields
+        nonlocal retries
+        nonlocal retrydelay
+        if (opt == "--month"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --month option")
+            month = argv[i+1]
+            months = [month]
+            return(1)
+        elif (opt == "--months"):
+            if (i + 2 >= len(argv)):
+                fatalerr("Expected an argument to follow --month option")
+            monthfrom = int(argv[i+1])
+            monthto = int(argv[i+2])
+            months = []
+            for month in range(monthfrom,monthto+1):
+                if (month < 10):
+                    thismonth = "0" + str(month)
+                else:
+                    thismonth = str(month)
+                months.append(thismonth)
+            return(2)
+        elif (opt == "--coordinates"):
+            if (i + 2 >= len(argv)):
+                fatalerr("Expected an argument to follow --coordinates option")
+            latitude = str(float(argv[i+1]))
+            longitude= str(float(argv[i+2]))
+            coordinatesgiven = 1
+            return(2)
+        elif (opt == "--sites"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --sites option")
+            sitesfile = argv[i+1]
+            return(1)
+        elif (opt == "--cluster-span"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --cluster-span option")
+            clusterspan = float(argv[i+1])
+            return(1)
+        elif (opt == "--update"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --update option")
+            updatefile = argv[i+1]
+            return(1)
+        elif (opt == "--profile"):
+            profile = 1
+            return(0)
+        elif (opt == "--profile-file"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --profile-file option")
+            profile = 1
+            profilefile = argv[i+1]
+            return(1)
+        elif (opt == "--profile-dump"):
+            if (i + 2 >= len(argv)):
+                fatalerr("Expected two arguments to follow --profile-dump option")
+            profile = 1
+            dumpstage = argv[i+1]
+            dumpfile = argv[i+2]
+            return(2)
+        elif (opt == "--jobs"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --jobs option")
+            jobs = int(argv[i+1])
+            if (jobs < 1):
+                fatalerr("Number of jobs must be at least 1")
+            return(1)
+        elif (opt == "--async"):
+            asyncmode = 1
+            return(0)
+        elif (opt == "--no-cache"):
+            usecache = 0
+            return(0)
+        elif (opt == "--refresh"):
+            refresh = 1
+            return(0)
+        elif (opt == "--cache-dir"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --cache-dir option")
+            cachedir = argv[i+1]
+            return(1)
+        elif (opt == "--cache-size"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --cache-size option")
+            cachesize = int(argv[i+1])
+            return(1)
+        elif (opt == "--max-fields"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --max-fields option")
+            maxfields = int(argv[i+1])
+            if (maxfields < minfields):
+                fatalerr("Maximum number of fields must be at least " + str(minfields))
+            return(1)
+        elif (opt == "--retries"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --retries option")
+            retries = int(argv[i+1])
+            return(1)
+        elif (opt == "--retry-delay"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --retry-delay option")
+            retrydelay = float(argv[i+1])
+            return(1)
+        elif (opt == "--dry-run"):
+            dryrun = 1
+            return(0)
+        elif (opt == "--chunk"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --chunk option")
+            chunking = argv[i+1]
+            if (chunking not in ["year", "month", "none"]):
+                fatalerr("Chunk unit must be year, month, or none")
+            return(1)
+        else:
+            fatalerr("Unrecognised option " + opt)
+            return(0)
+    #
+    # Inner function 'processargs'
+    #
+    def processargs():
+        print("Processing arguments...")
+        #print(f"Arguments count: {len(sys.argv)}")
+        nonlocal ystart;
+        nonlocal yend;
+        yearargs = 0
+        skipn = 0
+        for i, arg in enumerate(argv):
+            #print("Processing argument " + arg)
+            if (i == 0):
+                continue
+            elif (skipn > 0):
+                skipn = skipn - 1
+                #print("Skipped an argument")
+            else:
+                if (isoption(arg)):
+                    skipn = processoption(arg,i,argv)
+                else:
+                    if (yearargs == 0):
+                        ystart = int(arg)
+                        yend = ystart
+                        yearargs = 1
+                    elif (yearargs == 1):
+                        yend = int(arg)
+                        yearargs = 2
+                    else:
+                        fatalerr("Too many arguments")
+        #print("processed arguments...")
+    #
+    # Back to the main function
+    #
+    processargs()
+    if (sitesfile != "" and updatefile != ""):
+        fatalerr("Options --sites and --update cannot be used together")
+        return
+    #
+    # Inner function 'process', doing the main function
+    #
+    def process():
+        settings = {
+            "cachedir"   : cachedir,
+            "cachesize"  : cachesize,
+            "maxfields"  : maxfields,
+            "retries"    : retries,
+            "retrydelay" : retrydelay
+        }
+        if (updatefile != ""):
+            if (coordinatesgiven):
+                (updatelatitude, updatelongitude) = (latitude, longitude)
+            else:
+                (updatelatitude, updatelongitude) = (None, None)
+            if (update(updatefile, updatelatitude, updatelongitude,
+                       jobs, chunking, asyncmode, usecache, refresh, dryrun, **settings) and not dryrun):
+                print("Done")
+            return
+        years = list(range(ystart,yend+1))
+        if (sitesfile != ""):
+            if (pullsites(readsites(sitesfile), years, months, None, clusterspan,
+                          jobs, chunking, asyncmode, usecache, refresh, dryrun, **settings) is not None and not dryrun):
+                print("Done")
+            return
+        file_name = datafilename(years, months)
+        #
+        # Now actually getting the data
+        #
+        print("Getting data from " + str(ystart) + " to " + str(yend) + " now...")
+        print("Years = " + str([str(year) for year in years]))
+        print("Months = " + str(months))
+        print("File_name = " + file_name)
+        if (pull(years, months, latitude, longitude, file_name,
+                 jobs, chunking, asyncmode, usecache, refresh, dryrun, **settings) is None or dryrun):
+            return
+        #
+        # Done!
+        #
+        print("Done")
+    #
+    # Back to the main function
+    #
+    if (profile):
+        profiling.enable(dumpstage, dumpfile)
+    try:
+        process()
+    finally:
+        profiling.report("pull-data", profilefile)
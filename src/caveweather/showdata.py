@@ -0,0 +1,1415 @@
+#
+# Reading, summarizing, and printing weather data pulled with
+# pull-data.py. This is the library behind the show-data.py command;
+# see that command for a description of the options, and load,
+# aggregate, write, convert, and plot below for the functions to call.
+#
+
+import sys
+import os
+import json
+import concurrent.futures
+import heapq
+import numpy as np
+import pandas as pd
+from caveweather import profiling, CaveWeatherError
+
+#
+# netCDF4, matplotlib and pyarrow take a good part of a second to
+# import, and are imported only by the functions that need them, so
+# that e.g. reading a store and writing CSV does not pay for them.
+#
+
+invalid1 = -1.0842e-19
+invalid2 = -5.20417e-18
+invalid3 = 2.64698e-23
+invalid4 = 6.35275e-22
+debug = 0
+
+def fatalerr(x):
+    raise CaveWeatherError(x)
+
+def printdebug(x):
+    if (debug != 0):
+        print(x)
+
+def printwarning(x):
+    print("Warning: " + x, file = sys.stderr)
+        
+def isoption(x):
+    if (len(x) > 0 and x[0] == '-'):
+        return(1)
+    else:
+        return(0)
+
+#
+# Cleaning of invalid values in the raw input columns, per netCDF
+# variable: a comparison ("le" replaces values less than or equal to
+# an invalid value, "eq" replaces values equal to it), the invalid
+# values, and the replacement value. Comparisons use a relative
+# tolerance, as the invalid values are rounded. Values marked by the
+# _FillValue or missing_value attributes are always replaced with NaN.
+# Only values that the replacement changes are counted as invalid.
+#
+
+cleanspec = {
+    "t2m"  : ("eq", [-32767.0],                               np.nan),
+    "cp"   : ("le", [invalid1, invalid2],                     0.0),
+    "ro"   : ("le", [invalid1, invalid2],                     0.0),
+    "sro"  : ("le", [invalid1, invalid2, invalid3, invalid4], 0.0),
+    "ssro" : ("le", [invalid1, invalid2, invalid3, invalid4], 0.0),
+    "e"    : ("eq", [invalid1, invalid2],                     0.0),
+    "es"   : ("eq", [invalid1, invalid2],                     0.0)
+}
+cleantolerance = 1e-4
+cleaned = {}
+
+def cdcleancol(cd,col,data):
+    var = cd.variables[col]
+    mask = np.ma.getmaskarray(data)
+    values = np.ma.getdata(data).astype(np.float64)
+    if (not hasattr(var, 'scale_factor') and not hasattr(var, 'add_offset')):
+        for attr in ['_FillValue', 'missing_value']:
+            if (hasattr(var, attr)):
+                mask = mask | np.isin(values, np.atleast_1d(getattr(var, attr)))
+    count = int(np.count_nonzero(mask))
+    values[mask] = np.nan
+    if (col in cleanspec):
+        (how, invalids, newval) = cleanspec[col]
+        if (how == "le"):
+            limit = max(invalids)
+            bad = values <= limit + abs(limit) * cleantolerance
+        else:
+            bad = np.zeros(len(values), dtype = bool)
+            for invalid in invalids:
+                bad |= np.abs(values - invalid) <= abs(invalid) * cleantolerance
+        count = count + int(np.count_nonzero(bad & (values != newval)))
+        values[bad] = newval
+    cleaned[col] = cleaned.get(col, 0) + count
+    printdebug("replaced " + str(count) + " invalid values in column " + col)
+    return(values)
+
+#
+# Report the invalid values replaced in each column since the last
+# report, on one line
+#
+
+def reportcleaned():
+    counts = [col + " " + str(cleaned[col]) for col in cleaned if cleaned[col] > 0]
+    if (len(counts) > 0):
+        printwarning("Replaced invalid values: " + ", ".join(counts))
+    cleaned.clear()
+
+def cdgetcol(cd,col,start = None,stop = None):
+    printdebug("get column " + col)
+    with profiling.stage("read") as counts:
+        result = cd.variables[col][start:stop].flatten()
+        counts["rows"] = len(result)
+    printdebug("got column " + col + ": length = " + str(len(result)) + " type = " + str(type(result)))
+    with profiling.stage("clean") as counts:
+        result = cdcleancol(cd,col,result)
+        counts["rows"] = len(result)
+    printdebug("got cleaned column " + col + ": length = " + str(len(result)) + " type = " + str(type(result)))
+    return(result)
+
+#
+# Units of the netCDF time variable, mapped to pandas timedelta units
+#
+
+timeunits = {
+    "days"         : "D",
+    "hours"        : "h",
+    "minutes"      : "min",
+    "seconds"      : "s",
+    "milliseconds" : "ms",
+    "microseconds" : "us"
+}
+
+#
+# Calendars that can be decoded directly with numpy/pandas datetime
+# arithmetic. Others go through netCDF4's num2date.
+
+realcalendars = ["standard", "gregorian", "proleptic_gregorian"]
+
+def cdgettime(cd,start = None,stop = None):
+    printdebug("get time column")
+    timevar = cd.variables['time']
+    values = timevar[start:stop].flatten()
+    if (np.ma.is_masked(values)):
+        fatalerr("Missing time values in hours " + str(start) + " to " + str(stop) +
+                 " of the time axis; the columns cannot be aligned")
+    values = np.ma.getdata(values)
+    units = timevar.units
+    calendar = getattr(timevar, 'calendar', 'standard').lower()
+    unitparts = units.split(" since ")
+    if (len(unitparts) != 2):
+        fatalerr("Cannot parse time units " + units)
+    step = unitparts[0].strip().lower()
+    if (calendar in realcalendars and step in timeunits):
+        origin = pd.Timestamp(unitparts[1].strip())
+        if (origin.tzinfo is not None):
+            origin = origin.tz_convert(None)
+        result = origin + pd.to_timedelta(values, unit=timeunits[step])
+    else:
+        from netCDF4 import num2date
+        dates = num2date(values, units, calendar,
+                         only_use_cftime_datetimes=False,
+                         only_use_python_datetimes=True)
+        result = pd.DatetimeIndex(dates)
+    printdebug("got time column: length = " + str(len(result)))
+    return(result.values.astype("datetime64[s]"))
+
+#
+# Hourly columns and the netCDF variables they are read from, in the
+# order of the columns in the hourly table
+#
+
+hourlyvariables = {
+    "t2m"              : "t2m",
+    "precip"           : "cp",
+    "runoff"           : "ro",
+    "surfacerunoff"    : "sro",
+    "subsurfacerunoff" : "ssro",
+    "runoffrate"       : "mror",
+    "evap"             : "e",
+    "snowevap"         : "es",
+    "snowdepth"        : "sd"
+}
+
+#
+# Read the given hourly columns (by default, all of them) from a set of
+# netCDF files or stores (see write_store). Variables not needed for
+# any of the columns are not read. If 'compact' is set, the columns are
+# made float32 as each file is read, so that no float64 copy of all
+# the data is ever held. If a single store is read, the columns are
+# memory-mapped views of the store files, not copies.
+#
+
+def read_netcdf_files(file_locations,columns = None,timerange = None,precedence = "newest",compact = 0):
+    if (columns is None):
+        columns = list(hourlyvariables.keys())
+    columns = [col for col in hourlyvariables if col in columns]
+    data = {}
+    for col in columns:
+        data[col] = []
+    time = []
+    masks = None
+    cleaned.clear()
+    if (len(file_locations) > 1):
+        with profiling.stage("merge-plan"):
+            masks = mergeplan(file_locations,timerange,precedence)
+    dtype = np.float32 if compact else np.float64
+    for (chunkdata, chunktime) in readchunks(file_locations,columns,None,timerange,masks):
+        for col in columns:
+            if (compact):
+                chunkdata[col] = chunkdata[col].astype(np.float32, copy = False)
+            data[col].append(chunkdata[col])
+        time.append(chunktime)
+    with profiling.stage("concatenate") as counts:
+        for col in columns:
+            data[col] = concatenate(data[col], dtype)
+            printdebug(col + " len " + str(len(data[col])))
+        time = concatenate(time, "datetime64[s]")
+        printdebug("time len " + str(len(time)))
+        if (len(time) > 1 and not (time[1:] >= time[:-1]).all()):
+            order = np.argsort(time, kind = 'stable')
+            time = time[order]
+            for col in columns:
+                data[col] = data[col][order]
+        counts["rows"] = len(time)
+    reportcleaned()
+    return(makeframe(data,time))
+
+def makeframe(data,time):
+    return(pd.DataFrame(data, index = pd.DatetimeIndex(time, name = "time"), copy = False))
+
+#
+# Read the given hourly columns from a set of netCDF files or stores,
+# one file or, if 'chunkhours' is given, one chunk of at most that
+# many hours at a time. If 'timerange' is given, only the hours in
+# that range are read (see timeslice). If 'masks' is given, it has for
+# each file either None or an array telling which of the hours in the
+# time range to keep (see mergeplan). Yields a tuple (data, time) for
+# each chunk, where data maps the columns to arrays.
+#
+
+def readchunks(file_locations,columns,chunkhours = None,timerange = None,masks = None):
+    for (k, file_location) in enumerate(file_locations):
+        mask = None if masks is None else masks[k]
+        for (data, time, lo, start, stop) in readfilechunks(file_location,columns,chunkhours,timerange):
+            if (mask is not None):
+                keep = mask[start-lo:stop-lo]
+                if (not keep.all()):
+                    for col in columns:
+                        data[col] = data[col][keep]
+                    time = time[keep]
+            yield (data, time)
+
+def readfilechunks(file_location,columns,chunkhours,timerange):
+    if (isstore(file_location)):
+        (storedata, storetime) = read_store(file_location,columns)
+        (lo, hi) = timeslice(storetime,timerange)
+        step = chunkhours if chunkhours is not None else max(hi - lo, 1)
+        for start in range(lo, hi, step):
+            stop = min(start + step, hi)
+            data = {}
+            with profiling.stage("read") as counts:
+                for col in columns:
+                    data[col] = storedata[col][start:stop]
+                counts["rows"] = stop - start
+            yield (data, storetime[start:stop], lo, start, stop)
+        return
+    import netCDF4
+    f = netCDF4.Dataset(file_location) # open the .nc file
+    printdebug("Opened file " + file_location)
+    printdebug("Variables: ")
+    printdebug(f.variables)
+    (lo, hi) = cdtimeslice(f,timerange)
+    step = chunkhours if chunkhours is not None else max(hi - lo, 1)
+    for start in range(lo, hi, step):
+        stop = min(start + step, hi)
+        data = {}
+        for col in columns:
+            data[col] = cdgetcol(f,hourlyvariables[col],start,stop)
+        # Convert temperatures from Kelvin to Celsius, i.e., subtract 273.15
+        if ("t2m" in data):
+            data["t2m"] = data["t2m"] - 273.15
+        with profiling.stage("decode-time") as counts:
+            time = cdgettime(f,start,stop)
+            counts["rows"] = len(time)
+        yield (data, time, lo, start, stop)
+    f.close()
+    #printdebug(f)
+
+#
+# Time ranges are tuples (start, stop) of datetime64 values, where
+# either can be None, and stop is exclusive. The index range of the
+# hours within a time range is found by binary search over the sorted
+# time axis, so that only the matching part of each variable is read.
+#
+
+def timeslice(time,timerange):
+    if (timerange is None):
+        return(0, len(time))
+    (start, stop) = timerange
+    lo = 0 if start is None else int(np.searchsorted(time, start, side = 'left'))
+    hi = len(time) if stop is None else int(np.searchsorted(time, stop, side = 'left'))
+    return(lo, max(lo, hi))
+
+def cdtimeslice(cd,timerange):
+    timevar = cd.variables['time']
+    n = len(timevar)
+    if (timerange is None):
+        return(0, n)
+    calendar = getattr(timevar, 'calendar', 'standard')
+    import netCDF4
+    def bisect(when):
+        value = netCDF4.date2num(pd.Timestamp(when).to_pydatetime(), timevar.units, calendar)
+        lo = 0
+        hi = n
+        while (lo < hi):
+            mid = (lo + hi) // 2
+            if (timevar[mid] < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return(lo)
+    (start, stop) = timerange
+    lo = 0 if start is None else bisect(start)
+    hi = n if stop is None else bisect(stop)
+    return(lo, max(lo, hi))
+
+#
+# The times of the first and last hour in a file or store, read from
+# the ends of its time axis only
+#
+
+def timespan(file_location):
+    if (isstore(file_location)):
+        time = read_store(file_location,[])[1]
+        if (len(time) == 0):
+            return(np.datetime64("NaT"), np.datetime64("NaT"))
+        return(time[0], time[len(time)-1])
+    import netCDF4
+    f = netCDF4.Dataset(file_location)
+    n = len(f.variables['time'])
+    if (n == 0):
+        f.close()
+        return(np.datetime64("NaT"), np.datetime64("NaT"))
+    result = (cdgettime(f,0,1)[0], cdgettime(f,n-1,n)[0])
+    f.close()
+    return(result)
+
+def overlaps(span,timerange):
+    (first, last) = span
+    if (np.isnat(first)):
+        return(0)
+    if (timerange is None):
+        return(1)
+    (start, stop) = timerange
+    if (start is not None and last < start):
+        return(0)
+    if (stop is not None and first >= stop):
+        return(0)
+    return(1)
+
+#
+# Plan the merge of several files. Each file's time axis is a sorted
+# run of hours; files whose time spans overlap are k-way merged with a
+# heap, and of any hour present in more than one file only the copy in
+# the file with the highest precedence is kept. The precedence is
+# 'newest' or 'oldest' (by file modification time), or 'first' or
+# 'last' (by order on the command line). Duplicates dropped and gaps
+# found in the merged time axis are reported. Returns, for each file,
+# None if all its hours in the time range are kept, or else an array
+# telling which of them to keep.
+#
+
+hourstep = 3600
+
+def readtimes(file_location,timerange):
+    if (isstore(file_location)):
+        time = read_store(file_location,[])[1]
+        (lo, hi) = timeslice(time,timerange)
+        return(time[lo:hi].astype(np.int64))
+    import netCDF4
+    f = netCDF4.Dataset(file_location)
+    (lo, hi) = cdtimeslice(f,timerange)
+    time = cdgettime(f,lo,hi).astype(np.int64)
+    f.close()
+    return(time)
+
+def precedencerank(file_locations,precedence):
+    n = len(file_locations)
+    if (precedence == "first"):
+        order = list(range(n))
+    elif (precedence == "last"):
+        order = list(range(n-1, -1, -1))
+    else:
+        mtimes = [os.path.getmtime(file_location) for file_location in file_locations]
+        if (precedence == "oldest"):
+            order = sorted(range(n), key = lambda i: (mtimes[i], i))
+        else:
+            order = sorted(range(n), key = lambda i: (-mtimes[i], -i))
+    rank = [0] * n
+    for (r, i) in enumerate(order):
+        rank[i] = r
+    return(rank)
+
+def mergerun(times,rank,i):
+    for (pos, t) in enumerate(times.tolist()):
+        yield (t, rank, i, pos)
+
+def mergeplan(file_locations,timerange,precedence):
+    runs = [readtimes(file_location,timerange) for file_location in file_locations]
+    rank = precedencerank(file_locations,precedence)
+    masks = [None] * len(runs)
+    gaps = []
+    duplicates = 0
+    #
+    # Group the files with overlapping time spans
+    #
+    order = sorted([i for i in range(len(runs)) if len(runs[i]) > 0], key = lambda i: runs[i][0])
+    groups = []
+    groupend = None
+    for i in order:
+        if (groupend is not None and runs[i][0] <= groupend):
+            groups[len(groups)-1].append(i)
+            groupend = max(groupend, runs[i][len(runs[i])-1])
+        else:
+            groups.append([i])
+            groupend = runs[i][len(runs[i])-1]
+    #
+    # Merge each group
+    #
+    last = None
+    for group in groups:
+        first = min([runs[i][0] for i in group])
+        if (last is not None and first - last > hourstep):
+            gaps.append((last, first))
+        if (len(group) == 1):
+            times = runs[group[0]]
+            steps = np.nonzero(np.diff(times) > hourstep)[0]
+            for j in steps:
+                gaps.append((times[j], times[j+1]))
+            last = times[len(times)-1]
+            continue
+        keep = {}
+        for i in group:
+            keep[i] = np.zeros(len(runs[i]), dtype = bool)
+        for (t, r, i, pos) in heapq.merge(*[mergerun(runs[i],rank[i],i) for i in group]):
+            if (t == last):
+                duplicates = duplicates + 1
+                continue
+            if (last is not None and t - last > hourstep):
+                gaps.append((last, t))
+            keep[i][pos] = True
+            last = t
+        for i in group:
+            if (not keep[i].all()):
+                masks[i] = keep[i]
+    if (duplicates > 0):
+        printwarning("Dropped " + str(duplicates) + " duplicate hours")
+    for (start, stop) in gaps:
+        printwarning("Gap in data after " + str(np.datetime64(int(start), 's')) +
+                     " until " + str(np.datetime64(int(stop), 's')) +
+                     " (" + str((stop - start) // hourstep - 1) + " hours missing)")
+    return(masks)
+
+#
+# Concatenate arrays, without copying if there is only one
+#
+
+def concatenate(arrays,dtype):
+    if (len(arrays) == 0):
+        return(np.array([], dtype = dtype))
+    if (len(arrays) == 1):
+        return(arrays[0])
+    return(np.concatenate(arrays))
+
+#
+# A store is a directory with the hourly data in columnar form: one
+# float32 .npy file per column, time.npy with int64 seconds since
+# 1970, and index.json describing the site, years, and columns.
+#
+
+storeindex = "index.json"
+
+def isstore(file_location):
+    return(os.path.isfile(os.path.join(file_location, storeindex)))
+
+def read_store(store,columns):
+    printdebug("Opened store " + store)
+    with open(os.path.join(store, storeindex)) as f:
+        index = json.load(f)
+    data = {}
+    for col in columns:
+        if (col not in index["columns"]):
+            fatalerr("Column " + col + " is not in store " + store)
+            continue
+        data[col] = np.load(os.path.join(store, col + ".npy"), mmap_mode = 'r')
+    time = np.load(os.path.join(store, "time.npy"), mmap_mode = 'r').view("datetime64[s]")
+    return(data, time)
+
+def write_store(values,store,site):
+    os.makedirs(store, exist_ok = True)
+    for col in values.columns:
+        np.save(os.path.join(store, col + ".npy"), values[col].to_numpy(dtype = np.float32))
+    time = values.index.values.astype("datetime64[s]").view(np.int64)
+    np.save(os.path.join(store, "time.npy"), time)
+    years = sorted(set(values.index.year.tolist()))
+    index = {
+        "site"      : site,
+        "years"     : years,
+        "rows"      : len(values.index),
+        "start"     : str(values.index.min()) if len(values.index) > 0 else None,
+        "end"       : str(values.index.max()) if len(values.index) > 0 else None,
+        "columns"   : dict([(col, hourlyvariables[col]) for col in values.columns])
+    }
+    with open(os.path.join(store, storeindex), "w") as f:
+        json.dump(index, f, indent = 2)
+    printdebug("Wrote store " + store + " with " + str(len(values.index)) + " rows")
+
+#
+# The site of a netCDF file, as its first latitude and longitude
+#
+
+def cdsite(file_location):
+    if (isstore(file_location)):
+        with open(os.path.join(file_location, storeindex)) as f:
+            return(json.load(f)["site"])
+    import netCDF4
+    f = netCDF4.Dataset(file_location)
+    site = {
+        "latitude"  : float(f.variables['latitude'][0]),
+        "longitude" : float(f.variables['longitude'][0])
+    }
+    f.close()
+    return(site)
+
+#
+# Group hourly values by day. The grouping key is the real date
+# (midnight of each day), not a formatted string.
+#
+
+def dfgroupbydate(values):
+    return(values.groupby(values.index.normalize().rename("date")))
+
+#
+# Daily aggregation specification. Each output column is computed from
+# an hourly input column with an aggregation function (sum, mean, min,
+# or max). The order here is the order of columns in --combined output.
+#
+
+dailyspec = {
+    "precip"           : ("precip",           "sum"),
+    "evap"             : ("evap",             "sum"),
+    "snowevap"         : ("snowevap",         "sum"),
+    "runoff"           : ("runoff",           "sum"),
+    "surfacerunoff"    : ("surfacerunoff",    "sum"),
+    "subsurfacerunoff" : ("subsurfacerunoff", "sum"),
+    "runoffrate"       : ("runoffrate",       "mean"),
+    "min t2m"          : ("t2m",              "min"),
+    "avg t2m"          : ("t2m",              "mean"),
+    "max t2m"          : ("t2m",              "max"),
+    "snowdepth"        : ("snowdepth",        "mean")
+}
+
+#
+# Output columns for each mode, as a subset of dailyspec
+#
+
+modecolumns = {
+    "precipitation"    : ["precip"],
+    "temperature"      : ["min t2m", "avg t2m", "max t2m"],
+    "runoff"           : ["runoff"],
+    "surfacerunoff"    : ["surfacerunoff"],
+    "subsurfacerunoff" : ["subsurfacerunoff"],
+    "runoffrate"       : ["runoffrate"],
+    "evaporation"      : ["evap"],
+    "snowevaporation"  : ["snowevap"],
+    "snowdepth"        : ["snowdepth"],
+    "combined"         : ["precip", "evap", "snowevap",
+                          "runoff", "surfacerunoff", "subsurfacerunoff",
+                          "min t2m", "avg t2m", "max t2m",
+                          "snowdepth"]
+}
+
+#
+# Compute all the given daily output columns in a single grouped pass
+#
+
+def dailyaggregate(values,columns):
+    aggs = {}
+    for col in columns:
+        (incol, func) = dailyspec[col]
+        aggs[col] = pd.NamedAgg(column = incol, aggfunc = func)
+    return(dfgroupbydate(values).agg(**aggs))
+
+#
+# Streaming daily aggregation. Each chunk of hourly data is reduced to
+# per-day partial statistics (sums, counts, minimums, and maximums),
+# which are combined across chunks. Days that span chunks or files are
+# completed only when all of their hours have been seen.
+#
+
+chunkhours = 24 * 366
+
+partialstats = {
+    "sum"  : ["sum"],
+    "mean" : ["sum", "count"],
+    "min"  : ["min"],
+    "max"  : ["max"]
+}
+
+def partialcolumns(columns):
+    result = []
+    for col in columns:
+        (incol, func) = dailyspec[col]
+        for stat in partialstats[func]:
+            if ((incol, stat) not in result):
+                result.append((incol, stat))
+    return(result)
+
+def dailypartials(values,columns):
+    aggs = {}
+    for (incol, stat) in partialcolumns(columns):
+        aggs[incol + " " + stat] = pd.NamedAgg(column = incol, aggfunc = stat)
+    return(dfgroupbydate(values).agg(**aggs))
+
+def combinepartials(partials):
+    funcs = {}
+    for col in partials.columns:
+        stat = col.split(" ")[-1]
+        if (stat == "count"):
+            funcs[col] = "sum"
+        else:
+            funcs[col] = stat
+    return(partials.groupby(level = 0).agg(funcs))
+
+def finishpartials(partials,columns):
+    result = {}
+    for col in columns:
+        (incol, func) = dailyspec[col]
+        if (func == "mean"):
+            result[col] = partials[incol + " sum"] / partials[incol + " count"]
+        else:
+            result[col] = partials[incol + " " + func]
+    return(pd.DataFrame(result, index = partials.index))
+
+#
+# Partial statistics of each chunk of a file
+#
+
+def filepartials(file_location,columns,timerange = None,mask = None):
+    inputs = [col for col in hourlyvariables if col in [dailyspec[c][0] for c in columns]]
+    for (data, time) in readchunks([file_location],inputs,chunkhours,timerange,[mask]):
+        if (len(time) == 0):
+            continue
+        with profiling.stage("aggregate") as counts:
+            partials = dailypartials(makeframe(data,time),columns)
+            counts["rows"] = len(time)
+        yield(partials)
+
+#
+# Worker process function for --jobs: decode and pre-aggregate one
+# file, and return its partial statistics as plain numpy arrays,
+# together with the counts of invalid values replaced and the stages
+# profiled in the worker.
+#
+
+def setupworker(debugvalue,profile):
+    global debug
+    debug = debugvalue
+    if (profile):
+        profiling.enable()
+
+def workerpartials(file_location,columns,timerange,mask):
+    cleaned.clear()
+    frames = list(filepartials(file_location,columns,timerange,mask))
+    if (len(frames) == 0):
+        return(None, None, dict(cleaned), profiling.collect())
+    if (len(frames) == 1):
+        partials = frames[0]
+    else:
+        partials = combinepartials(pd.concat(frames))
+    arrays = {}
+    for col in partials.columns:
+        arrays[col] = partials[col].to_numpy()
+    return(partials.index.values, arrays, dict(cleaned), profiling.collect())
+
+def workerresult(result):
+    (dates, arrays, counts, stages) = result
+    for col in counts:
+        cleaned[col] = cleaned.get(col, 0) + counts[col]
+    profiling.merge(stages)
+    if (dates is None):
+        return([])
+    return([pd.DataFrame(arrays, index = pd.DatetimeIndex(dates, name = "date"))])
+
+#
+# Aggregate the given daily columns from a set of files, reading one
+# chunk at a time. Files are processed in time order, or, with more
+# than one job, pre-aggregated in parallel in worker processes and
+# merged in time order. Yields the finished days as DataFrames, as
+# soon as no later chunk or file can add hours to them.
+#
+
+def streamaggregate(file_locations,columns,jobs = 1,timerange = None,precedence = "newest"):
+    cleaned.clear()
+    spans = [timespan(file_location) for file_location in file_locations]
+    selected = [i for i in range(len(file_locations)) if overlaps(spans[i],timerange)]
+    printdebug("skipping " + str(len(file_locations) - len(selected)) + " files outside the time range")
+    starts = {}
+    for i in selected:
+        starts[i] = spans[i][0]
+        if (timerange is not None and timerange[0] is not None and starts[i] < timerange[0]):
+            starts[i] = timerange[0]
+    masks = {}
+    if (len(selected) > 1):
+        with profiling.stage("merge-plan"):
+            plan = mergeplan([file_locations[i] for i in selected],timerange,precedence)
+        for (k, i) in enumerate(selected):
+            masks[i] = plan[k]
+    order = sorted(selected, key = lambda i: starts[i])
+    ordered = [file_locations[i] for i in order]
+    orderedmasks = [masks.get(i) for i in order]
+    pool = None
+    if (jobs > 1 and len(ordered) > 1):
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers = jobs,
+                                                      initializer = setupworker,
+                                                      initargs = (debug, profiling.enabled))
+        perfile = map(workerresult, pool.map(workerpartials, ordered,
+                                             [columns] * len(ordered),
+                                             [timerange] * len(ordered),
+                                             orderedmasks))
+    else:
+        perfile = map(lambda file_location, mask: filepartials(file_location,columns,timerange,mask),
+                      ordered, orderedmasks)
+    carry = None
+    try:
+        for (k, frames) in enumerate(perfile):
+            if (k + 1 < len(order)):
+                nextstart = pd.Timestamp(starts[order[k+1]]).normalize()
+            else:
+                nextstart = None
+            for partials in frames:
+                if (len(partials.index) == 0):
+                    continue
+                #
+                # The last day may continue in the next chunk, and the days
+                # from the start of the next file on may get more hours
+                # from it.
+                #
+                limit = partials.index.max()
+                if (nextstart is not None and nextstart < limit):
+                    limit = nextstart
+                with profiling.stage("combine") as counts:
+                    if (carry is not None):
+                        partials = combinepartials(pd.concat([carry, partials]))
+                    done = partials[partials.index < limit]
+                    carry = partials[partials.index >= limit]
+                    if (len(done.index) > 0):
+                        done = finishpartials(done,columns)
+                    counts["rows"] = len(done.index)
+                if (len(done.index) > 0):
+                    yield(done)
+    finally:
+        if (pool is not None):
+            pool.shutdown(cancel_futures = True)
+    if (carry is not None and len(carry.index) > 0):
+        with profiling.stage("combine") as counts:
+            done = finishpartials(carry,columns)
+            counts["rows"] = len(done.index)
+        yield(done)
+    reportcleaned()
+
+#
+# The finished days as they come from streamaggregate, or an empty
+# table if there are none, so that there is always a frame to take the
+# columns from
+#
+
+def dailyframes(file_locations,columns,jobs = 1,timerange = None,precedence = "newest"):
+    empty = 1
+    for frame in streamaggregate(file_locations,columns,jobs,timerange,precedence):
+        empty = 0
+        yield(frame)
+    if (empty):
+        yield(pd.DataFrame(columns = columns, index = pd.DatetimeIndex([], name = "date")))
+
+def streamdaily(file_locations,columns,jobs = 1,timerange = None,precedence = "newest"):
+    frames = list(dailyframes(file_locations,columns,jobs,timerange,precedence))
+    if (len(frames) == 1):
+        return(frames[0])
+    return(pd.concat(frames))
+
+#
+# Resample daily values to longer calendar periods, and over rolling
+# windows of periods. Each column is combined with the same function
+# that made it from the hourly values, e.g., daily precipitation is
+# summed to weekly precipitation, and daily minimum temperatures give
+# the weekly minimum. Periods are labeled by their first day; weeks
+# start on Mondays.
+#
+
+periodfreqs = {
+    "day"   : None,
+    "week"  : "W",
+    "month" : "M",
+    "year"  : "Y"
+}
+
+def periodaggregate(daily,period):
+    freq = periodfreqs[period]
+    if (freq is None):
+        return(daily)
+    start = daily.index.to_period(freq).start_time.rename("date")
+    aggs = {}
+    for col in daily.columns:
+        aggs[col] = dailyspec[col][1]
+    return(daily.groupby(start).agg(aggs))
+
+def rollingaggregate(values,n):
+    if (n <= 1):
+        return(values)
+    window = values.rolling(n, min_periods = n)
+    result = pd.DataFrame({col: getattr(window[col], dailyspec[col][1])()
+                           for col in values.columns})
+    return(result.iloc[n-1:])
+
+#
+# Output. Tables are written out in chunks of rows, either as CSV or
+# as an aligned text table, with numbers formatted to six significant
+# digits. Daily tables start with a date column; hourly tables (--full)
+# end with separate date and time columns. In text tables numbers are
+# aligned on their decimal points, and the column widths are found in
+# a first pass over the data, so the text of the whole table never
+# needs to be held in memory.
+#
+
+outputchunkrows = 65536
+
+def outputcolumns(df,rownumbers):
+    if (df.index.name == "date"):
+        return(["date"] + list(df.columns))
+    if (rownumbers):
+        return([""] + list(df.columns) + ["date", "time"])
+    return(list(df.columns) + ["date", "time"])
+
+def formatcells(df,col,lo,hi):
+    if (col == ""):
+        return([str(i) for i in range(lo, hi)])
+    if (col == "date"):
+        dates = np.datetime_as_string(df.index.values[lo:hi], unit = 'D')
+        return([date.replace("-", "/") for date in dates.tolist()])
+    if (col == "time"):
+        times = np.datetime_as_string(df.index.values[lo:hi], unit = 's')
+        return([time[11:] for time in times.tolist()])
+    return(["%g" % x for x in df[col].to_numpy()[lo:hi].tolist()])
+
+def istextcolumn(col):
+    return(col == "date" or col == "time")
+
+def afterpoint(cell):
+    pos = cell.rfind(".")
+    if (pos < 0):
+        pos = cell.rfind("e")
+    if (pos < 0):
+        return(-1)
+    return(len(cell) - pos - 1)
+
+def writecsv(df,out,header = 1):
+    columns = outputcolumns(df,0)
+    if (header):
+        out.write(",".join(columns) + "\n")
+    for lo in range(0, len(df), outputchunkrows):
+        hi = min(lo + outputchunkrows, len(df))
+        cells = [formatcells(df,col,lo,hi) for col in columns]
+        out.write("".join([",".join(row) + "\n" for row in zip(*cells)]))
+
+def writetext(df,out):
+    columns = outputcolumns(df,1)
+    #
+    # First pass: find the widths of the integral and fractional parts
+    # of the numbers, or the widths of text, in each column
+    #
+    integral = [0] * len(columns)
+    decimals = [-1] * len(columns)
+    for lo in range(0, len(df), outputchunkrows):
+        hi = min(lo + outputchunkrows, len(df))
+        for (j, col) in enumerate(columns):
+            for cell in formatcells(df,col,lo,hi):
+                after = -1 if istextcolumn(col) else afterpoint(cell)
+                integral[j] = max(integral[j], len(cell) - after)
+                decimals[j] = max(decimals[j], after)
+    widths = [max(integral[j] + decimals[j], len(col) + 2) for (j, col) in enumerate(columns)]
+    #
+    # Second pass: write the header and the rows
+    #
+    header = [col.ljust(widths[j]) if istextcolumn(col) else col.rjust(widths[j])
+              for (j, col) in enumerate(columns)]
+    out.write("  ".join(header).rstrip() + "\n")
+    out.write("  ".join(["-" * width for width in widths]) + "\n")
+    for lo in range(0, len(df), outputchunkrows):
+        hi = min(lo + outputchunkrows, len(df))
+        cells = []
+        for (j, col) in enumerate(columns):
+            if (istextcolumn(col)):
+                cells.append([cell.ljust(widths[j]) for cell in formatcells(df,col,lo,hi)])
+            else:
+                cells.append([(cell + " " * (decimals[j] - afterpoint(cell))).rjust(widths[j])
+                              for cell in formatcells(df,col,lo,hi)])
+        out.write("".join(["  ".join(row).rstrip() + "\n" for row in zip(*cells)]))
+
+def writetable(df,out,csv):
+    if (csv):
+        printdebug("doing csv")
+        writecsv(df,out)
+    else:
+        printdebug("not doing csv")
+        writetext(df,out)
+
+#
+# Binary output. The frame is written with a datetime column ('date' for
+# daily tables, 'time' for hourly ones) and float32 value columns, in
+# Parquet or Arrow IPC files (requires pyarrow) or in a netCDF file.
+# Each column is compressed.
+#
+
+binaryformats = ["parquet", "arrow", "netcdf"]
+
+def typedcolumns(df):
+    timename = "date" if df.index.name == "date" else "time"
+    time = df.index.values.astype("datetime64[s]")
+    values = dict([(col, df[col].to_numpy(dtype = np.float32)) for col in df.columns])
+    return(timename, time, values)
+
+def arrowtable(df):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        fatalerr("Writing Parquet or Arrow output needs the pyarrow module")
+        raise
+    (timename, time, values) = typedcolumns(df)
+    columns = [(timename, pa.array(time))] + [(col, pa.array(values[col])) for col in values]
+    return(pa.table(dict(columns)))
+
+def writeparquet(df,file_location):
+    import pyarrow.parquet as pq
+    pq.write_table(arrowtable(df), file_location, compression = "zstd")
+
+def writearrow(df,file_location):
+    import pyarrow as pa
+    table = arrowtable(df)
+    options = pa.ipc.IpcWriteOptions(compression = "zstd")
+    with pa.OSFile(file_location, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options = options) as writer:
+            writer.write_table(table)
+
+def writenetcdf(df,file_location):
+    import netCDF4
+    (timename, time, values) = typedcolumns(df)
+    out = netCDF4.Dataset(file_location, "w")
+    out.createDimension(timename, None)
+    chunk = min(max(len(time), 1), 8784)
+    timevar = out.createVariable(timename, 'i8', (timename,), zlib = True, chunksizes = [chunk])
+    timevar.units = "seconds since 1970-01-01 00:00:00"
+    timevar.calendar = "proleptic_gregorian"
+    timevar[:] = time.view(np.int64)
+    for col in values:
+        var = out.createVariable(col.replace(" ", "_"), 'f4', (timename,), fill_value = np.float32(np.nan),
+                                 zlib = True, chunksizes = [chunk])
+        var.long_name = col
+        var[:] = values[col]
+    out.close()
+
+def writebinary(df,file_location,outputformat):
+    printdebug("writing " + outputformat + " to " + file_location)
+    if (outputformat == "parquet"):
+        writeparquet(df,file_location)
+    elif (outputformat == "arrow"):
+        writearrow(df,file_location)
+    else:
+        writenetcdf(df,file_location)
+
+def writeoutput(df,outputformat,output):
+    if (outputformat in binaryformats):
+        writebinary(df,output,outputformat)
+    elif (output != ""):
+        with open(output, "w") as out:
+            writetable(df,out,outputformat == "csv")
+    else:
+        writetable(df,sys.stdout,outputformat == "csv")
+
+#
+# Plotting. All columns are drawn into one figure, each in its own
+# style. Series with more points than the figure is wide in pixels are
+# decimated to the minimum and maximum of each pixel-wide bucket, which
+# keeps their visible shape. The figure is shown interactively, or, if
+# a file is given, saved to it without any interactive backend in the
+# format given by the file extension (e.g., png, svg, or pdf).
+#
+
+plotstyles = {
+    "min t2m"          : ("pink",   0.5, "--"),
+    "max t2m"          : ("pink",   0.5, "--"),
+    "avg t2m"          : ("red",    1.5, "-"),
+    "precip"           : ("blue",   1.5, "-"),
+    "snowdepth"        : ("black",  1.5, "-"),
+    "runoff"           : ("green",  1.5, "-"),
+    "surfacerunoff"    : ("green",  1.5, "-"),
+    "subsurfacerunoff" : ("green",  1.5, "-"),
+    "evap"             : ("grey",   1.5, "-"),
+    "snowevap"         : ("yellow", 1.5, "-")
+}
+
+plotsize = (17,6)
+plotdpi = 100
+
+def decimate(x,y,pixels):
+    n = len(y)
+    if (n <= 2 * pixels):
+        return(x, y)
+    bucket = -(-n // pixels)
+    buckets = -(-n // bucket)
+    padded = np.pad(y, (0, buckets * bucket - n), mode = 'edge').reshape(buckets, bucket)
+    low = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis = 1)
+    high = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis = 1)
+    offsets = np.arange(buckets) * bucket
+    index = np.sort(np.stack([low + offsets, high + offsets], axis = 1), axis = 1).ravel()
+    index = np.minimum(index, n - 1)
+    return(x[index], y[index])
+
+def dfplot(df,file_location = None):
+    import matplotlib.dates as mdates
+    if (file_location is None):
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize = plotsize, dpi = plotdpi)
+    else:
+        import matplotlib.figure
+        fig = matplotlib.figure.Figure(figsize = plotsize, dpi = plotdpi)
+    ax = fig.add_subplot()
+    ax.set_xlabel("Date")
+    pixels = max(int(ax.bbox.width), 1)
+    x = df.index.values
+    for col in df.columns:
+        if (col not in plotstyles):
+            continue
+        (color, width, style) = plotstyles[col]
+        (px, py) = decimate(x, df[col].to_numpy(dtype = np.float64), pixels)
+        ax.plot(px, py, color = color, linewidth = width, linestyle = style, label = col)
+    ax.legend(loc = "upper right")
+    ax.xaxis.set_major_locator(mdates.YearLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    if (len(x) > 0 and x[len(x)-1] - x[0] <= np.timedelta64(10 * 366, 'D')):
+        ax.xaxis.set_minor_locator(mdates.MonthLocator())
+    for label in ax.get_xticklabels(which = 'major'):
+        label.set(rotation = 30, horizontalalignment = 'right')
+    if (file_location is None):
+        plt.show()
+    else:
+        fig.savefig(file_location)
+
+#
+# Library interface. These functions do what the show-data.py command
+# does, on DataFrames. Input files are netCDF files or stores, given as
+# a list or as a single file name. The dates 'start' and 'end' are
+# 'yyyy-mm-dd' strings or numpy datetime64 values, and both days are
+# included. Failures raise CaveWeatherError.
+#
+
+def parsedate(date):
+    return(np.datetime64(date, 'D'))
+
+def daterange(start = None, end = None):
+    if (start is None and end is None):
+        return(None)
+    return((None if start is None else parsedate(start).astype("datetime64[s]"),
+            None if end is None else (parsedate(end) + 1).astype("datetime64[s]")))
+
+def filelist(file_locations):
+    if (isinstance(file_locations, str)):
+        return([file_locations])
+    return(list(file_locations))
+
+#
+# Read hourly data into a DataFrame with a datetime index and a column
+# per hourly variable (see hourlyvariables)
+#
+
+def load(file_locations, columns = None, start = None, end = None, precedence = "newest", compact = 0):
+    return(read_netcdf_files(filelist(file_locations),columns,daterange(start,end),precedence,compact))
+
+#
+# Compute the output table of a mode (see modecolumns), with daily rows
+# or rows per longer period. The data is either an hourly DataFrame
+# from load, or input files, which are then streamed through without
+# reading them into memory at once.
+#
+
+def aggregate(data, mode = "combined", period = "day", rolling = 1, jobs = 1,
+              start = None, end = None, precedence = "newest"):
+    if (mode not in modecolumns):
+        fatalerr("Invalid mode " + mode)
+        return(None)
+    if (isinstance(data, pd.DataFrame)):
+        with profiling.stage("aggregate") as counts:
+            (lo, hi) = timeslice(data.index.values,daterange(start,end))
+            daily = dailyaggregate(data.iloc[lo:hi],modecolumns[mode])
+            counts["rows"] = hi - lo
+    else:
+        daily = streamdaily(filelist(data),modecolumns[mode],jobs,daterange(start,end),precedence)
+    with profiling.stage("resample") as counts:
+        result = rollingaggregate(periodaggregate(daily,period),rolling)
+        counts["rows"] = len(daily.index)
+    return(result)
+
+#
+# Write a table to a file, to an open text file, or by default to the
+# standard output, in any of the output formats. The table may also be
+# given as a sequence of frames with the same columns (e.g., from
+# dailyframes), which are written as CSV one at a time, as they come.
+# Text tables need the widths of all rows, and binary formats are
+# written as one table, so in those formats the frames are first
+# concatenated.
+#
+
+def writeframes(frames, out):
+    header = 1
+    for df in frames:
+        with profiling.stage("write") as counts:
+            writecsv(df,out,header)
+            header = 0
+            counts["rows"] = len(df.index)
+
+def write(df, output = None, format = "text"):
+    if (not isinstance(df, pd.DataFrame)):
+        if (format != "csv"):
+            df = pd.concat(list(df))
+        elif (hasattr(output, "write")):
+            writeframes(df,output)
+            return
+        elif (output is None or output == ""):
+            writeframes(df,sys.stdout)
+            return
+        else:
+            with open(output, "w") as out:
+                writeframes(df,out)
+            return
+    with profiling.stage("write") as counts:
+        if (hasattr(output, "write")):
+            writetable(df,output,format == "csv")
+        else:
+            writeoutput(df,format,"" if output is None else output)
+        counts["rows"] = len(df.index)
+
+#
+# Convert files into a store. The store holds float32 columns, so with
+# 'compact' the data is read as float32 to begin with.
+#
+
+def convert(file_locations, store, start = None, end = None, precedence = "newest", compact = 0):
+    file_locations = filelist(file_locations)
+    values = load(file_locations,None,start,end,precedence,compact)
+    with profiling.stage("write-store") as counts:
+        write_store(values, store, cdsite(file_locations[0]))
+        counts["rows"] = len(values.index)
+    return(store)
+
+def plot(df, file_location = None):
+    with profiling.stage("plot") as counts:
+        dfplot(df, file_location)
+        counts["rows"] = len(df.index)
+
+#
+# The command. Fatal errors are printed, and exit with status 1.
+#
+
+def main(argv = None):
+    try:
+        command(argv)
+    except CaveWeatherError as e:
+        print("Fatal error: " + str(e) + " -- exit")
+        sys.exit(1)
+
+def command(argv = None):
+    if (argv is None):
+        argv = sys.argv
+    mode = "combined"
+    plotting = 0
+    plotfile = ""
+    outputformat = "text"
+    output = ""
+    file_names = ["data.nc"]
+    file_names_given = 0
+    store = ""
+    jobs = 1
+    fromdate = None
+    todate = None
+    precedence = "newest"
+    period = "day"
+    rolling = 1
+    compact = 0
+    profile = 0
+    profilefile = ""
+    dumpstage = ""
+    dumpfile = ""
+    #
+    # Inner function 'processoption'
+    #
+    def processoption(opt,i,argv):
+        nonlocal mode
+        nonlocal outputformat
+        nonlocal output
+        nonlocal plotting
+        nonlocal plotfile
+        nonlocal store
+        nonlocal jobs
+        nonlocal fromdate
+        nonlocal todate
+        nonlocal precedence
+        nonlocal period
+        nonlocal rolling
+        nonlocal compact
+        nonlocal profile
+        nonlocal profilefile
+        nonlocal dumpstage
+        nonlocal dumpfile
+        global debug
+        if (opt == "--temperature"):
+            mode = "temperature"
+            return(0)
+        elif (opt == "--full"):
+            mode = "full"
+            return(0)
+        elif (opt == "--precipitation"):
+            mode = "precipitation"
+            return(0)
+        elif (opt == "--runoff"):
+            mode = "runoff"
+            return(0)
+        elif (opt == "--surfacerunoff"):
+            mode = "surfacerunoff"
+            return(0)
+        elif (opt == "--subsurfacerunoff"):
+            mode = "subsurfacerunoff"
+            return(0)
+        elif (opt == "--runoffrate"):
+            mode = "runoffrate"
+            return(0)
+        elif (opt == "--evaporation"):
+            mode = "evaporation"
+            return(0)
+        elif (opt == "--snowevaporation"):
+            mode = "snowevaporation"
+            return(0)
+        elif (opt == "--snowdepth"):
+            mode = "snowdepth"
+            return(0)
+        elif (opt == "--combined"):
+            mode = "combined"
+            return(0)
+        elif (opt == "--text"):
+            outputformat = "text"
+            return(0)
+        elif (opt == "--csv"):
+            outputformat = "csv"
+            return(0)
+        elif (opt == "--format"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --format option")
+            outputformat = argv[i+1]
+            if (outputformat not in ["text", "csv"] + binaryformats):
+                fatalerr("Format must be text, csv, parquet, arrow, or netcdf")
+            return(1)
+        elif (opt == "--output"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --output option")
+            output = argv[i+1]
+            return(1)
+        elif (opt == "--debug"):
+            debug = 1
+            return(0)
+        elif (opt == "--convert"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --convert option")
+            store = argv[i+1]
+            return(1)
+        elif (opt == "--from" or opt == "--to"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow " + opt + " option")
+            try:
+                parsedate(argv[i+1])
+            except ValueError:
+                fatalerr("Invalid date " + argv[i+1] + ", expected yyyy-mm-dd")
+                return(1)
+            if (opt == "--from"):
+                fromdate = argv[i+1]
+            else:
+                todate = argv[i+1]
+            return(1)
+        elif (opt == "--precedence"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --precedence option")
+            precedence = argv[i+1]
+            if (precedence not in ["newest", "oldest", "first", "last"]):
+                fatalerr("Precedence must be newest, oldest, first, or last")
+            return(1)
+        elif (opt == "--period"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --period option")
+            period = argv[i+1]
+            if (period not in periodfreqs):
+                fatalerr("Period must be day, week, month, or year")
+            return(1)
+        elif (opt == "--rolling"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --rolling option")
+            rolling = int(argv[i+1])
+            if (rolling < 1):
+                fatalerr("Rolling window must be at least 1 period")
+            return(1)
+        elif (opt == "--compact"):
+            compact = 1
+            return(0)
+        elif (opt == "--profile"):
+            profile = 1
+            return(0)
+        elif (opt == "--profile-file"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --profile-file option")
+            profile = 1
+            profilefile = argv[i+1]
+            return(1)
+        elif (opt == "--profile-dump"):
+            if (i + 2 >= len(argv)):
+                fatalerr("Expected two arguments to follow --profile-dump option")
+            profile = 1
+            dumpstage = argv[i+1]
+            dumpfile = argv[i+2]
+            return(2)
+        elif (opt == "--jobs"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --jobs option")
+            jobs = int(argv[i+1])
+            if (jobs < 1):
+                fatalerr("Number of jobs must be at least 1")
+            return(1)
+        elif (opt == "--plot"):
+            plotting = 1
+            return(0)
+        elif (opt == "--plot-file"):
+            if (i + 1 >= len(argv)):
+                fatalerr("Expected an argument to follow --plot-file option")
+            plotting = 1
+            plotfile = argv[i+1]
+            return(1)
+        else:
+            fatalerr("Unrecognised option " + opt)
+            return(0)
+    #
+    # Inner function 'processargs'
+    #
+    def processargs():
+        #print("Processing arguments...")
+        #print(f"Arguments count: {len(sys.argv)}")
+        nonlocal file_names
+        file_name_set = 0
+        skipn = 0
+        for i, arg in enumerate(argv):
+            #print("Processing argument " + arg)
+            if (i == 0):
+                continue
+            elif (skipn > 0):
+                skipn = skipn - 1
+                #print("Skipped an argument")
+            else:
+                if (isoption(arg)):
+                    skipn = processoption(arg,i,argv)
+                else:
+                    if (file_name_set == 0):
+                        file_names = [arg]
+                        file_name_set = 1
+                    else:
+                        file_names.append(arg)
+    #
+    # Back to the main function
+    #
+    processargs()
+    if (outputformat in binaryformats and output == ""):
+        fatalerr("Format " + outputformat + " needs an output file, given with --output")
+        return
+    #
+    # Inner function 'process', doing the main function
+    #
+    def process():
+        if (store != ""):
+            convert(file_names, store, fromdate, todate, precedence, compact)
+            return
+        if (mode == "full"):
+            if (period != "day" or rolling != 1):
+                fatalerr("Options --period and --rolling cannot be used with --full")
+                return
+            write(load(file_names, None, fromdate, todate, precedence, compact), output, outputformat)
+            return
+        if (period == "day" and rolling == 1 and plotting == 0):
+            write(dailyframes(file_names, modecolumns[mode], jobs, daterange(fromdate, todate), precedence),
+                  output, outputformat)
+            return
+        processed_data = aggregate(file_names, mode, period, rolling, jobs, fromdate, todate, precedence)
+        if (processed_data is None):
+            return
+        if (plotting != 0):
+            plot(processed_data, plotfile if plotfile != "" else None)
+        else:
+            write(processed_data, output, outputformat)
+    #
+    # Back to the main function
+    #
+    if (profile):
+        profiling.enable(dumpstage, dumpfile)
+    try:
+        process()
+    finally:
+        profiling.report("show-data", profilefile)
@@ -15,6 +15,13 @@
 # -month.nc or -month-month.nc. You may later use the show-data.py
 # program to print out the pulled data.
 #
+# The progress of the pull is kept in the file data-ystart-yend.nc.state
+# until the pull is complete. If the pull fails or is interrupted,
+# running the same command again continues from where it stopped: the
+# chunks already downloaded are not requested again, interrupted
+# downloads are continued, and requests already queued at CDS are
+# waited for instead of queued again.
+#
 # The pull-data.py command may also invoked with options:
 #
 #   --month nn             Pull only month nn (expressed as a two-digit
@@ -27,167 +34,95 @@
 #                          default the command uses the corodinates of
 #                          Njiellalanjävri in northern Finland.
 #
+#   --sites sites.csv      Pull data for many sites, listed in a CSV
+#                          file with lines 'name,latitude,longitude'.
+#                          Nearby sites are pulled together in one
+#                          request for an area covering them, and the
+#                          nearest grid cell of each site is written to
+#                          a file data-name-ystart-yend.nc.
+#
+#   --cluster-span deg     Pull together sites that fit in an area of
+#                          at most 'deg' degrees of latitude and
+#                          longitude. The default is 2.
+#
+#   --update file.nc       Extend an existing file with any newer data.
+#                          The months after the last time in the file,
+#                          up to and including the current (partial)
+#                          month, are pulled and appended to the file
+#                          in place. Year and month arguments are
+#                          ignored. Unless --coordinates is given, the
+#                          coordinates are taken from the file.
+#
+#   --jobs n               Download with up to n parallel requests. The
+#                          pull is split into chunks (per year, by
+#                          default) that are fetched concurrently and
+#                          then merged into the output file.
+#
+#   --async                Queue all chunks at CDS at once, without
+#                          waiting for each one to complete, and then
+#                          download each as soon as it is ready.
+#
+#   --no-cache             Do not use the local cache of pulled data.
+#                          By default, data is cached per month and
+#                          only months not in the cache are pulled.
+#
+#   --refresh              Pull everything again, and update the cache.
+#
+#   --cache-dir dir        Keep the cache in directory 'dir'. The
+#                          default is ~/.cache/cave-weather-data.
+#
+#   --cache-size mb        Limit the cache to 'mb' megabytes, evicting
+#                          the least recently used months. The default
+#                          is 1024.
+#
+#   --chunk unit           Split the pull into chunks per 'year' or
+#                          per 'month', or not at all ('none'). The
+#                          default is 'none' with one job and 'year'
+#                          with several jobs or with --async.
+#
+#   --max-fields n         Split requests so that none asks for more
+#                          than n fields (variables x days x hours),
+#                          the CDS limit on the size of a request. The
+#                          default is 120000. Each request asks only
+#                          for dates that exist, so months of 31 and
+#                          30 days and February are requested
+#                          separately. Larger requests are split by
+#                          years, months, or groups of variables,
+#                          whichever needs the fewest requests, and the
+#                          results are merged.
+#
+#   --retries n            Retry failed requests up to n times. The
+#                          default is 4.
+#
+#   --retry-delay s        Wait 's' seconds before the first retry, and
+#                          twice as long before each further one. The
+#                          default is 30.
+#
+#   --dry-run              Only print the planned requests and their
+#                          sizes, without contacting CDS. The cache is
+#                          consulted as usual.
+#
+#   --profile              Print a JSON summary of where the time went
+#                          to the standard error: the wall and CPU time
+#                          and peak memory use of each stage (requests,
+#                          cache, merging, etc), and for each CDS
+#                          request the time spent queued at CDS, the
+#                          time spent downloading, and bytes downloaded.
+#
+#   --profile-file f       Write the profile summary to file 'f' instead.
+#
+#   --profile-dump stage file
+#                          Also run the given stage (e.g., 'merge')
+#                          under cProfile, and dump the statistics to
+#                          'file' for pstats.
+#
 
 import sys
-import cdsapi
-import netCDF4
-from netCDF4 import num2date
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-def fatalerr(x):
-    print("Fatal error: " + x + " -- exit")
-    SystemExit(1)
-    
-def isoption(x):
-    if (len(x) > 0 and x[0] == '-'):
-        return(1)
-    else:
-        return(0)
-
-#    Input:
-#        year, month, day, area, time, file_location: Strings
-#    Outputs:
-#        file_location: A string as in input
-
-def getdata(year, month, day, area, time, file_location):
-    c = cdsapi.Client() 
-    c.retrieve(
-        'reanalysis-era5-single-levels',{
-            'product_type':'reanalysis', # This is the dataset produced by the CDS
-            'variable':['2m_temperature','convective_precipitation','runoff','sub_surface_runoff','surface_runoff','mean_runoff_rate','evaporation','snow_evaporation','snow_depth'],
-            'year': year,
-            'month': month,
-            'day': day,
-            'area': area,
-            'time': time,
-            'format':'netcdf' # The format we choose to use
-        },
-        file_location)
-    return(file_location)
+import os
 
-def main():
-    latitude  = "69.232023" # Njiellalanjävri
-    longitude = "21.420556"
-    ystart = 2019 # latest year in the database
-    yend = ystart
-    months = ["01","02","03","04","05","06","07","08","09","10","11","12"] # all months
-    #
-    # Inner function 'constructyeartable'
-    #
-    def constructyeartable(ystart,yend):
-        tab = []
-        for year in range(ystart,yend+1):
-            tab.append(str(year))
-        return(tab)
-    #
-    # Inner function 'processoption'
-    #
-    def processoption(opt,i,argv):
-        nonlocal months
-        nonlocal latitude; 
-        nonlocal longitude;
-        if (opt == "--month"):
-            if (i + 1 >= len(argv)):
-                fatalerr("Expected an argument to follow --month option")
-            month = argv[i+1]
-            months = [month]
-            return(1)
-        elif (opt == "--months"):
-            if (i + 2 >= len(argv)):
-                fatalerr("Expected an argument to follow --month option")
-            monthfrom = int(argv[i+1])
-            monthto = int(argv[i+2])
-            months = []
-            for month in range(monthfrom,monthto+1):
-                if (month < 10):
-                    thismonth = "0" + str(month)
-                else:
-                    thismonth = str(month)
-                months.append(thismonth)
-            return(2)
-        elif (opt == "--coordinates"):
-            if (i + 2 >= len(argv)):
-                fatalerr("Expected an argument to follow --coordinates option")
-            latitude = float(argv[i+1])
-            longitude= float(argv[i+2])
-            return(2)
-        else:
-            fatalerr("Unrecognised option " + opt)
-            return(0)
-    #
-    # Inner function 'processargs'
-    #
-    def processargs():
-        print("Processing arguments...")
-        #print(f"Arguments count: {len(sys.argv)}")
-        nonlocal ystart;
-        nonlocal yend;
-        yearargs = 0
-        skipn = 0
-        for i, arg in enumerate(sys.argv):
-            #print("Processing argument " + arg)
-            if (i == 0):
-                continue
-            elif (skipn > 0):
-                skipn = skipn - 1
-                #print("Skipped an argument")
-            else:
-                if (isoption(arg)):
-                    skipn = processoption(arg,i,sys.argv)
-                else:
-                    if (yearargs == 0):
-                        ystart = int(arg)
-                        yend = ystart
-                        yearargs = 1
-                    elif (yearargs == 1):
-                        yend = int(arg)
-                        yearargs = 2
-                    else:
-                        fatalerr("Too many arguments")
-        #print("processed arguments...")
-    #
-    # Back to the main function
-    #
-    processargs()
-    #
-    # Set up the parameters
-    #
-    years = constructyeartable(ystart,yend)
-    if (len(months) == 12):
-        monthpart = ""
-    elif (len(months) == 1):
-        monthpart = "-" + months[0]
-    else:
-        monthpart = "-" + months[0] + "-" + months[len(months)-1]
-    file_name = 'data-' + str(ystart) + "-" + str(yend) + monthpart + ".nc"
-    #
-    # Now actually getting the data
-    #
-    print("Getting data from " + str(ystart) + " to " + str(yend) + " now...")
-    print("Years = " + str(years))
-    print("Months = " + str(months))
-    print("File_name = " + file_name)
-    file_location = getdata(
-        year  = years,
-    
-        # NB: Single digits days or months must have 0s in front or that will cause an error
-        day   = ['01', '02', '03','04', '05', '06','07','08','09','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31'],
-        month = months,
-    
-        # The ERA5 accept rectangular shape grid as a searching areas
-        # but we can use also input a point with this system:ß
-        area  = latitude +'/'+ longitude +'/'+ latitude +'/'+ longitude,
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-        # Get all hours to get the precipation data right
-        time = ['00:00','01:00','02:00','03:00','04:00','05:00','06:00','07:00','08:00','09:00','10:00','11:00','12:00','13:00','14:00','15:00','16:00','17:00','18:00','19:00','20:00','21:00','22:00','23:00',],
-        # We can request one per each day
-        # time  = ['14:00'], # noon in Finland
-        file_location = file_name)
-    #
-    # Done!
-    #
-    print("Done")
+from caveweather.pulldata import main
 
-main()
+if (__name__ == "__main__"):
+    main()